@@ -2,13 +2,54 @@ import fitz
 from langchain.docstore.document import Document
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 import json
-    
-def extract_paragraphs(pdf_path):
+import re
+from collections import Counter
+
+## Page headers and footers ("Invoices   3-11", "3-12   Oracle Payables User's Guide") repeat on every
+## page with only the page number changing. They are dropped before chunking so they aren't embedded
+## hundreds of times and don't make otherwise unrelated chunks look alike.
+def _line_shape(line):
+    return re.sub(r"\d+", "#", " ".join(line.split())).lower()
+
+## A page number ("3-11", "C-4", "Index-2") opening or closing the line; "..., page 3-11" is a cross reference
+_RUNNING_HEADER = re.compile(r"^(?:[a-z]+-)?#(?:-#)?\s.*[a-z]|^(?!.*\bpage #).*[a-z].*\s(?:[a-z]+-)?#(?:-#)?$|^[a-z]+-#$")
+
+def repeated_edge_lines(pages, edge=2, min_pages=3):
+    """
+    Shapes (digits masked) of running headers/footers: lines numbered like a page that are
+    among the first/last `edge` lines of at least `min_pages` pages.
+    """
+    counts = Counter()
+    for lines in pages:
+        lines = [line for line in lines if line.strip()]
+        counts.update({_line_shape(line) for line in lines[:edge] + lines[-edge:]})
+    return {shape for shape, count in counts.items() if count >= min_pages and _RUNNING_HEADER.search(shape)}
+
+def strip_edge_lines(lines, repeated, edge=2):
+    ## Top of the page, then the bottom (reversed twice, so the order is kept)
+    for _ in range(2):
+        kept, seen = [], 0
+        for i, line in enumerate(lines):
+            if seen >= edge:
+                kept.extend(lines[i:])
+                break
+            if line.strip():
+                seen += 1
+                if _line_shape(line) in repeated:
+                    continue
+            kept.append(line)
+        lines = kept[::-1]
+    return lines
+
+def extract_paragraphs(pdf_path, strip_headers=True):
     doc = fitz.open(pdf_path)
     paragraphs = []
+
+    pages = [page.get_text("text").split("\n") for page in doc]
+    repeated = repeated_edge_lines(pages) if strip_headers else set()
     
-    for page_num, page in enumerate(doc, start=1):
-        text = page.get_text("text")
+    for page_num, lines in enumerate(pages, start=1):
+        text = "\n".join(strip_edge_lines(lines, repeated))
         blocks = [p.strip() for p in text.split('\n\n') if len(p.strip()) > 30]  # Ignore tiny lines
         for block in blocks:
             paragraphs.append({
@@ -55,11 +96,23 @@ def save_chunks_to_json(chunks, output_path="chunks.json"):
     print(f"✅ Saved {len(serialized)} chunks to {output_path}")
 
 # 📦 Full pipeline
+#   python Indexing/chunking.py [pdf_path] [output_path] [--no-dedupe] [--keep-headers], one run per manual
 if __name__ == "__main__":
-    pdf_path = "resources/manual.pdf"
-    paragraphs = extract_paragraphs(pdf_path)
+    import sys
+    from dedupe import dedupe_chunks, print_dedupe_report
+
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    pdf_path = args[0] if len(args) > 0 else "resources/manual.pdf"
+    output_path = args[1] if len(args) > 1 else "resources/chunks.json"
+
+    paragraphs = extract_paragraphs(pdf_path, strip_headers="--keep-headers" not in sys.argv)
     grouped_docs = group_paragraphs(paragraphs, group_size=3)
     chunks = chunk_documents(grouped_docs)
+
+    ## Collapse near-duplicate chunks before they are embedded
+    if "--no-dedupe" not in sys.argv:
+        chunks, report = dedupe_chunks(chunks)
+        print_dedupe_report(report)
     
-    save_chunks_to_json(chunks, "resources/chunks.json")
+    save_chunks_to_json(chunks, output_path)
     
\ No newline at end of file
@@ -0,0 +1,171 @@
+import re
+import zlib
+
+import numpy as np
+
+
+"""
+Near-duplicate chunk elimination, run between chunk_documents and embedding
+
+Running page headers are already stripped line by line in chunking.extract_paragraphs; this
+stage catches chunks that repeat as a whole (a procedure or note copied into several chapters).
+Each chunk is reduced to its word shingles and a MinHash signature; LSH banding finds the
+candidate pairs and the ones whose estimated Jaccard similarity reaches `threshold` are
+collapsed into the first chunk of their cluster. The kept chunk records every page range
+it stands for in metadata["page_ranges"], so citations still point at all the pages.
+"""
+
+## MinHash over 2^31 - 1 so a * x + b stays inside uint64
+_PRIME = (1 << 31) - 1
+_WORD = re.compile(r"\w+")
+
+## Embedding cost estimate: ~4 characters per token, text-embedding-ada-002 pricing, 1536 float32 dims
+CHARS_PER_TOKEN = 4
+PRICE_PER_MILLION_TOKENS = 0.10
+EMBEDDING_DIM = 1536
+
+
+def shingles(text, k=5):
+    """
+    Set of hashed k-word shingles of the normalized text.
+    """
+    words = _WORD.findall(text.lower())
+    if len(words) <= k:
+        return {zlib.crc32(" ".join(words).encode()) % _PRIME}
+    return {zlib.crc32(" ".join(words[i:i + k]).encode()) % _PRIME for i in range(len(words) - k + 1)}
+
+
+def minhash_signatures(shingle_sets, num_perm=128, seed=7):
+    """
+    Returns a (len(shingle_sets), num_perm) uint64 array of MinHash signatures.
+    """
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, _PRIME, size=num_perm, dtype=np.uint64)
+    b = rng.integers(0, _PRIME, size=num_perm, dtype=np.uint64)
+
+    signatures = np.empty((len(shingle_sets), num_perm), dtype=np.uint64)
+    for i, hashed in enumerate(shingle_sets):
+        values = np.fromiter(hashed, dtype=np.uint64, count=len(hashed))
+        signatures[i] = ((np.outer(values, a) + b) % _PRIME).min(axis=0)
+    return signatures
+
+
+def near_duplicate_clusters(signatures, threshold=0.85, bands=16):
+    """
+    Groups rows whose signatures agree on at least `threshold` of their positions.
+    Candidates come from LSH: rows sharing every value of at least one band.
+
+    Returns:
+        list of clusters, each a sorted list of row indexes (singletons included)
+    """
+    count, num_perm = signatures.shape
+    rows = num_perm // bands
+    parent = list(range(count))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    checked = set()
+    for band in range(bands):
+        buckets = {}
+        for i, key in enumerate(map(bytes, signatures[:, band * rows:(band + 1) * rows])):
+            buckets.setdefault(key, []).append(i)
+
+        for members in buckets.values():
+            for j in members[1:]:
+                first = members[0]
+                if (first, j) in checked:
+                    continue
+                checked.add((first, j))
+                if np.mean(signatures[first] == signatures[j]) >= threshold:
+                    parent[find(j)] = find(first)
+
+    clusters = {}
+    for i in range(count):
+        clusters.setdefault(find(i), []).append(i)
+    return sorted(clusters.values())
+
+
+def merge_page_ranges(ranges):
+    """
+    [[start, end], ...] -> sorted list with overlapping or adjacent ranges merged
+    """
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def _page_range(doc):
+    metadata = doc.metadata
+    if "page_ranges" in metadata:
+        return [list(r) for r in metadata["page_ranges"]]
+    if "page_start" in metadata:
+        return [[metadata["page_start"], metadata.get("page_end", metadata["page_start"])]]
+    return []
+
+
+def dedupe_chunks(chunks, threshold=0.85, num_perm=128, bands=16, k=5):
+    """
+    Collapses near-duplicate chunks, keeping the first of each cluster in order.
+
+    Args:
+        chunks (list[Document]): output of chunk_documents
+        threshold (float): estimated Jaccard similarity of shingles above which chunks are duplicates
+
+    Returns:
+        (kept chunks, report dict with the chunk, character, token, cost and index size savings)
+    """
+    if not chunks:
+        return [], dedupe_report(chunks, chunks)
+
+    signatures = minhash_signatures([shingles(chunk.page_content, k) for chunk in chunks], num_perm)
+    clusters = near_duplicate_clusters(signatures, threshold, bands)
+
+    kept = []
+    for cluster in clusters:
+        chunk = chunks[cluster[0]]
+        if len(cluster) > 1:
+            ranges = [r for i in cluster for r in _page_range(chunks[i])]
+            chunk.metadata["page_ranges"] = merge_page_ranges(ranges)
+            chunk.metadata["duplicates"] = len(cluster) - 1
+        kept.append(chunk)
+
+    return kept, dedupe_report(chunks, kept)
+
+
+def dedupe_report(before, after):
+    def stats(docs):
+        chars = sum(len(doc.page_content) for doc in docs)
+        tokens = chars / CHARS_PER_TOKEN
+        return {
+            "chunks": len(docs),
+            "characters": chars,
+            "estimated_tokens": int(tokens),
+            "estimated_cost_usd": round(tokens / 1_000_000 * PRICE_PER_MILLION_TOKENS, 6),
+            "index_bytes": len(docs) * EMBEDDING_DIM * 4,
+        }
+
+    before, after = stats(before), stats(after)
+    removed = before["chunks"] - after["chunks"]
+    return {
+        "before": before,
+        "after": after,
+        "removed_chunks": removed,
+        "shrink_percent": round(100 * removed / before["chunks"], 2) if before["chunks"] else 0.0,
+    }
+
+
+def print_dedupe_report(report):
+    before, after = report["before"], report["after"]
+    print(f"🧹 Removed {report['removed_chunks']} near-duplicate chunks "
+          f"({before['chunks']} -> {after['chunks']}, -{report['shrink_percent']}%)")
+    print(f"   Embedding tokens: ~{before['estimated_tokens']} -> ~{after['estimated_tokens']} "
+          f"(${before['estimated_cost_usd']} -> ${after['estimated_cost_usd']})")
+    print(f"   Index vectors: {before['index_bytes'] / 1e6:.2f} MB -> {after['index_bytes'] / 1e6:.2f} MB")
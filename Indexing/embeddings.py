@@ -4,6 +4,10 @@ from langchain.docstore.document import Document
 from langchain_community.vectorstores import FAISS
 import json
 import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..','retrieving')))
+from shards import save_shard, shard_name, DEFAULT_SHARD, DEFAULT_MANUAL # type: ignore
 
 
 # Load .env to save OPEN AI api key
@@ -27,8 +31,62 @@ def embedDataToFAISS(docs):
     vectorstore.save_local("faiss_oracle_index")
     print("\n✅ FAISS index saved to 'faiss_oracle_index/ \n'")
 
+    saveServingIndex(vectorstore)
+
+# Exports the FAISS vectors and docstore as the memory-mapped index shard the API workers serve from
+def saveServingIndex(vectorstore, shard=DEFAULT_SHARD, manual=DEFAULT_MANUAL):
+    count = vectorstore.index.ntotal
+    vectors = vectorstore.index.reconstruct_n(0, count)
+
+    documents = []
+    for i in range(count):
+        doc = vectorstore.docstore.search(vectorstore.index_to_docstore_id[i])
+        metadata = dict(doc.metadata)
+        metadata.setdefault("manual", shard_name(shard))
+        documents.append((doc.page_content, metadata))
+
+    entry = save_shard(shard, manual, vectors, documents, source="faiss_oracle_index")
+    print(f"\n✅ Shard '{shard_name(shard)}' saved (build {entry['build_id']}, {count} vectors) \n")
+
+# Embeds the chunks of one manual into its own index shard, the other shards are left as they are
+def embedShard(docs, shard, manual, source=None):
+    embedding_model = OpenAIEmbeddings()
+    shard = shard_name(shard)
+
+    ## Routing metadata, returned with the context pages
+    for doc in docs:
+        doc.metadata["manual"] = shard
+
+    print(f"\nEmbedding {len(docs)} chunks for shard '{shard}' \n")
+    vectors = embedding_model.embed_documents([doc.page_content for doc in docs])
+
+    entry = save_shard(shard, manual, vectors, [(doc.page_content, doc.metadata) for doc in docs], source=source)
+    print(f"\n✅ Shard '{shard}' saved (build {entry['build_id']}, {entry['count']} vectors) \n")
+
     
 if __name__ == "__main__":
-    docs = load_chunks_from_json("resources/chunks.json")
+    ## One shard per manual:
+    ##   python Indexing/embeddings.py --shard receivables --manual "Oracle Receivables User Guide, Release 12.2" --chunks resources/receivables_chunks.json
+    if "--shard" in sys.argv:
+        import argparse
+
+        parser = argparse.ArgumentParser()
+        parser.add_argument("--shard", required=True)
+        parser.add_argument("--manual", required=True)
+        parser.add_argument("--chunks", required=True)
+        args = parser.parse_args()
+
+        embedShard(load_chunks_from_json(args.chunks), args.shard, args.manual, source=args.chunks)
+
+    ## --export-only converts an existing faiss_oracle_index/ without re-embedding
+    elif "--export-only" in sys.argv:
+        vectorstore = FAISS.load_local(
+            folder_path="faiss_oracle_index",
+            embeddings=OpenAIEmbeddings(),
+            allow_dangerous_deserialization=True
+        )
+        saveServingIndex(vectorstore)
+    else:
+        docs = load_chunks_from_json("resources/chunks.json")
 
-    embedDataToFAISS(docs)
\ No newline at end of file
+        embedDataToFAISS(docs)
@@ -6,6 +6,7 @@ class MetaData(BaseModel):
     context_pages: List[dict] = []
     rewritten_query: str = ""
     raw_error: Optional[Union[str, dict]] = None
+    timeouts: List[str] = []  # stages that ran out of the request's deadline
 
 class ChatResponse(BaseModel):
     status: str  # "success" or "error"
@@ -1,11 +1,57 @@
-from typing import List
+from typing import List, Literal
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request, APIRouter
 from fastapi.middleware.cors import CORSMiddleware
-from services.initiator import handle_user_input
+from fastapi.middleware.gzip import GZipMiddleware
+from services.json_response import FastJSONResponse
+from config import ENDPOINT_DEADLINES, GZIP_MINIMUM_SIZE, WARMUP_RETRY_MAX_DELAY
+from services.deadline import Deadline
 from pydantic import BaseModel
+import asyncio
 import os
 
-app = FastAPI()
+## services.initiator (LangChain, OpenAI, MySQL, the index) is imported by the warm-up task,
+## not here, so the server starts accepting connections without waiting for it
+warmup_status = {"ready": False, "stages": {}}
+
+def warm_up_services(only=None):
+    from services.initiator import warm_up
+    return warm_up(only)
+
+## Failed stages (MySQL or OpenAI briefly unreachable at start) are retried with backoff
+## until they all succeed, so /ready recovers without a restart
+async def warm_up():
+    delay, failed = 1, None
+    while True:
+        try:
+            stages = await asyncio.to_thread(warm_up_services, failed)
+        except Exception as e:
+            stages = {"import": str(e)}
+
+        if failed is None:
+            warmup_status["stages"] = stages
+        else:
+            warmup_status["stages"].update(stages)
+
+        failed = [name for name, status in warmup_status["stages"].items() if status != "ok"]
+        warmup_status["ready"] = not failed
+        print(f"Warm-up {'finished' if not failed else f'incomplete, retrying in {delay}s'}: {warmup_status['stages']}")
+        if not failed:
+            return
+
+        ## After a failed import every stage is retried
+        if "import" in failed:
+            failed = None
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, WARMUP_RETRY_MAX_DELAY)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    warmup_task = asyncio.create_task(warm_up())
+    yield
+    warmup_task.cancel()
+
+app = FastAPI(default_response_class=FastJSONResponse, lifespan=lifespan)
 
 #Read and split allowed origins
 allowed_origins = os.getenv("ALLOWED_ORIGINS", "")
@@ -21,6 +67,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+## Compress large bodies (long SQL tables), small ones aren't worth the CPU
+app.add_middleware(GZipMiddleware, minimum_size=GZIP_MINIMUM_SIZE)
+
 api_router = APIRouter(prefix="/finance_chat/api")
 
 ## initialize a session store to store chat history
@@ -30,16 +79,35 @@ session_store: dict[str, List[dict[str, str]]] = {}
 class ChatInput(BaseModel):
     session_id: str
     question: str
+    ## "columnar" returns SQL results as {columns, rows} arrays instead of one object per row
+    response_format: Literal["rows", "columnar"] = "rows"
 
 @api_router.get("/")
 def read_root():
     return {"status": "Chatbot API is running"} 
 
+## Readiness probe, 503 until the warm-up has loaded the index, clients and DB pool
+@api_router.get("/ready")
+def ready():
+    return FastJSONResponse(warmup_status, status_code=200 if warmup_status["ready"] else 503)
+
+
+
+## Per-tier hit rate and latency of the SQL model cascade in this worker
+@api_router.get("/sql/cascade_stats")
+def sql_cascade_stats():
+    from services.sql_generator import get_cascade_stats
+    return get_cascade_stats()
 
 
 ## Chat end point which takes user's question and session ID in body
 @api_router.post("/chat")
 async def chat(input: ChatInput):
+    from services.initiator import handle_user_input
+
+    ## The time budget starts when the request comes in and is shared by every stage
+    deadline = Deadline(ENDPOINT_DEADLINES.get("chat"))
+
     session_id = input.session_id
     question = input.question
 
@@ -52,7 +120,7 @@ async def chat(input: ChatInput):
         session_store[session_id] = chat_history
 
     try:
-        response = await handle_user_input(question, chat_history)
+        response = await handle_user_input(question, chat_history, input.response_format, deadline)
     except Exception as e:
         return {"error": "Internal error processing chat", "details": str(e)}, 500
 
@@ -61,7 +129,8 @@ async def chat(input: ChatInput):
 
     session_store[session_id] = chat_history
 
-    return response
+    ## Returning the response directly skips FastAPI's jsonable_encoder pass over the result rows
+    return FastJSONResponse(response)
 
 ## ✅ New Endpoint: Get Chat History
 @api_router.get("/chat/history")
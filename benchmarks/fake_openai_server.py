@@ -0,0 +1,86 @@
+"""
+Local fake of the OpenAI chat completions API, for exercising the SQL model cascade
+without network calls or cost.
+
+Each model answers with a fixed SQL string after a fixed delay, so a cheap model can be
+made to return bad SQL (to force escalation) or good SQL (to be accepted):
+
+    python benchmarks/fake_openai_server.py --port 8099 \\
+        --reply "gpt-4o-mini=SELECT COUNT(*) FROM invoices WHERE Stat = 'Pending'" \\
+        --reply "gpt-4o=SELECT COUNT(*) FROM invoices WHERE Status = 'Pending'" \\
+        --delay-ms gpt-4o-mini=150 --delay-ms gpt-4o=900
+
+    SQL_MODEL_BASE_URL=http://127.0.0.1:8099/v1 OPENAI_API_KEY=fake \\
+        python benchmarks/sql_cascade.py "count of pending invoices"
+"""
+
+import argparse
+import json
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_REPLY = "SELECT COUNT(*) FROM invoices WHERE Status = 'Pending'"
+
+
+def parse_pairs(pairs):
+    parsed = {}
+    for pair in pairs or []:
+        model, _, value = pair.partition("=")
+        parsed[model.strip()] = value
+    return parsed
+
+
+def make_handler(replies, delays_ms):
+
+    class FakeChatCompletions(BaseHTTPRequestHandler):
+
+        def do_POST(self):
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self.send_error(404)
+                return
+
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            model = body.get("model", "")
+            time.sleep(float(delays_ms.get(model, 0)) / 1000)
+
+            content = replies.get(model, DEFAULT_REPLY)
+            payload = json.dumps({
+                "id": f"chatcmpl-fake-{time.time_ns()}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop",
+                }],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            }).encode()
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            print(f"[fake-openai] {self.address_string()} {format % args}")
+
+    return FakeChatCompletions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--reply", action="append", help="MODEL=SQL returned for that model")
+    parser.add_argument("--delay-ms", action="append", help="MODEL=MS simulated latency for that model")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(parse_pairs(args.reply), parse_pairs(args.delay_ms)))
+    print(f"Fake OpenAI API on http://{args.host}:{args.port}/v1")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Import-time report for the API.
+
+Runs `python -X importtime` in a fresh interpreter for:
+    app                  what uvicorn waits for before it accepts connections
+    services.initiator   everything the warm-up task imports to serve questions
+
+and prints the total and the slowest modules by cumulative time. The serving graph
+must not pull in indexing-only modules (PyMuPDF, the pickle FAISS store, Indexing/).
+
+Usage (from the project root):
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --top 30 --max-app-ms 300   # exit 1 on regressions
+"""
+
+import argparse
+import subprocess
+import sys
+
+## Modules only the indexing scripts need
+INDEXING_ONLY = ("fitz", "pymupdf", "Indexing", "langchain_community.vectorstores", "faiss")
+
+
+def import_times(module):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+
+    times = {}
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        ## Nested imports are indented by two spaces per level
+        times[name[1:].rstrip()] = int(cumulative_us)
+    return times
+
+
+def report(module, top):
+    times = import_times(module)
+    top_level = {name: us for name, us in times.items() if not name.startswith(" ")}
+    total_ms = sum(top_level.values()) / 1000
+
+    print(f"\n## import {module}: {total_ms:.0f} ms, {len(times)} modules\n")
+    for name, us in sorted(times.items(), key=lambda item: -item[1])[:top]:
+        print(f"{us / 1000:>9.1f} ms  {name.strip()}")
+
+    loaded = {name.strip() for name in times}
+    indexing = sorted(
+        name for name in loaded
+        if any(name == prefix or name.startswith(prefix + ".") for prefix in INDEXING_ONLY)
+    )
+    return total_ms, indexing
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--max-app-ms", type=float, default=None)
+    args = parser.parse_args()
+
+    failed = False
+
+    app_ms, app_indexing = report("app", args.top)
+    _serving_ms, serving_indexing = report("services.initiator", args.top)
+
+    if args.max_app_ms is not None and app_ms > args.max_app_ms:
+        print(f"\n❌ import app took {app_ms:.0f} ms, budget is {args.max_app_ms:.0f} ms")
+        failed = True
+
+    for name in sorted(set(app_indexing + serving_indexing)):
+        print(f"\n❌ Indexing-only module imported while serving: {name}")
+        failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
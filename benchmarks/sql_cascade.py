@@ -0,0 +1,37 @@
+"""
+Runs questions through the SQL model cascade (generation and validation only, nothing is
+executed) and prints which tier answered each one, plus the per-tier hit rate and latency.
+
+Point it at benchmarks/fake_openai_server.py with SQL_MODEL_BASE_URL for a local run,
+or at the real API to measure how often the fast tier is good enough:
+
+    python benchmarks/sql_cascade.py "count of pending invoices" "top 5 vendors by total"
+"""
+
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from services.sql_generator import generate_sql, get_cascade_stats
+
+
+def main():
+    questions = sys.argv[1:] or [
+        "count of pending invoices",
+        "total spent on vendor ABC",
+        "orders placed last week",
+        "top 5 vendors by total order value",
+    ]
+
+    for question in questions:
+        generated = generate_sql(question)
+        status = generated["error"] or "ok"
+        print(f"\n{question!r}\n  -> {generated['model']}: {generated['sql_query']}  [{status}]")
+
+    print("\n## Cascade stats\n")
+    print(json.dumps(get_cascade_stats(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Resident memory per worker: memory-mapped serving index vs a private copy per worker.
+
+Starts N worker processes the way uvicorn --workers N would, each opens the index and
+runs a few searches, then reports its memory from /proc/self/smaps_rollup (Linux):
+    Rss      pages resident for this process, shared pages counted in full
+    Pss      shared pages divided by the number of processes mapping them
+    Private  pages only this process has (what each extra worker really costs)
+
+Usage (from the project root):
+    python benchmarks/worker_memory.py --workers 4
+    python benchmarks/worker_memory.py --workers 4 --mode copy
+    python benchmarks/worker_memory.py --synthetic 200000   # build a throwaway index first
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'retrieving')))
+from mmap_index import MmapIndex, save_mmap_index, DEFAULT_PATH # type: ignore
+
+
+def memory_kb():
+    usage = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if parts[0] in ("Rss:", "Pss:", "Private_Clean:", "Private_Dirty:"):
+                usage[parts[0][:-1]] = int(parts[1])
+    usage["Private"] = usage.pop("Private_Clean") + usage.pop("Private_Dirty")
+    return usage
+
+
+def worker(folder, mode, queries, ready, done, results):
+    started = time.perf_counter()
+    index = MmapIndex(folder)
+
+    if mode == "copy":
+        ## What FAISS.load_local does: every worker reads the vectors and docstore into its own memory
+        index.vectors = np.array(index.vectors)
+        index.norms = np.array(index.norms)
+        documents = [index.document(i) for i in range(len(index))]
+    open_seconds = time.perf_counter() - started
+
+    rng = np.random.default_rng(os.getpid())
+    for _ in range(queries):
+        for position, _distance in index.search(rng.standard_normal(index.vectors.shape[1]), 4):
+            index.document(position)
+
+    ## Measure once every worker has touched the index, so shared pages are split between all of them
+    ready.wait()
+    results.put({"pid": os.getpid(), "open_ms": round(open_seconds * 1000, 1), **memory_kb()})
+    done.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--index", default=DEFAULT_PATH)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--mode", choices=["mmap", "copy"], default="mmap")
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--synthetic", type=int, default=0, help="build a random index with this many vectors")
+    parser.add_argument("--dim", type=int, default=1536)
+    args = parser.parse_args()
+
+    folder = args.index
+    if args.synthetic:
+        folder = os.path.join(tempfile.mkdtemp(), "index")
+        rng = np.random.default_rng(0)
+        vectors = rng.standard_normal((args.synthetic, args.dim), dtype=np.float32)
+        documents = [(f"chunk {i} " + "lorem ipsum " * 50, {"page_start": i, "page_end": i}) for i in range(args.synthetic)]
+        save_mmap_index(folder, vectors, documents)
+        del vectors, documents
+
+    ready = multiprocessing.Barrier(args.workers + 1)
+    done = multiprocessing.Event()
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=worker, args=(folder, args.mode, args.queries, ready, done, results))
+        for _ in range(args.workers)
+    ]
+    for process in processes:
+        process.start()
+    ready.wait()
+    rows = [results.get() for _ in processes]
+    done.set()
+    for process in processes:
+        process.join()
+
+    index_mb = sum(os.path.getsize(os.path.join(folder, name)) for name in os.listdir(folder)) / 1024
+    print(f"\nIndex: {folder} ({index_mb / 1024:.1f} MB on disk), mode={args.mode}, workers={args.workers}\n")
+    print(f"{'pid':>8} {'open ms':>9} {'Rss MB':>9} {'Pss MB':>9} {'Private MB':>11}")
+    for row in rows:
+        print(f"{row['pid']:>8} {row['open_ms']:>9} {row['Rss'] / 1024:>9.1f} {row['Pss'] / 1024:>9.1f} {row['Private'] / 1024:>11.1f}")
+
+    total_pss = sum(row["Pss"] for row in rows) / 1024
+    print(f"\nTotal Pss across workers: {total_pss:.1f} MB")
+    print(json.dumps({"mode": args.mode, "workers": args.workers, "total_pss_mb": round(total_pss, 1)}))
+
+
+if __name__ == "__main__":
+    main()
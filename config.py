@@ -0,0 +1,41 @@
+import os
+
+## Summary tables used by the aggregate router in services/aggregates.py
+AGGREGATE_ROUTING = os.getenv("AGGREGATE_ROUTING", "true").lower() == "true"
+## Seconds after a full summary rebuild during which Status-filtered/grouped aggregates may still be
+## answered from the summaries (status changes are only picked up by full rebuilds), 0 = never
+SUMMARY_STATUS_MAX_AGE = int(os.getenv("SUMMARY_STATUS_MAX_AGE", "0"))
+
+## Responses larger than this many bytes are gzip compressed
+GZIP_MINIMUM_SIZE = int(os.getenv("GZIP_MINIMUM_SIZE", "1024"))
+
+## Semantic cache of RAG answers, see services/answer_cache.py
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH", "answer_cache.npz")
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1000"))
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+
+## MySQL connections kept open per worker
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+
+## SQL generation model cascade, cheapest first, see services/sql_generator.generate_sql
+SQL_MODEL_TIERS = [model.strip() for model in os.getenv("SQL_MODEL_TIERS", "gpt-4o-mini,gpt-4o").split(",") if model.strip()]
+if not SQL_MODEL_TIERS:
+    raise ValueError("SQL_MODEL_TIERS must name at least one model")
+SQL_MODEL_BASE_URL = os.getenv("SQL_MODEL_BASE_URL") or None
+SQL_EXPLAIN_CHECK = os.getenv("SQL_EXPLAIN_CHECK", "false").lower() == "true"
+
+## Answer common SQL questions from local templates with prepared statements, skipping the LLMs
+SQL_TEMPLATES_ENABLED = os.getenv("SQL_TEMPLATES_ENABLED", "true").lower() == "true"
+
+## Time budget of one request in seconds, per endpoint ("chat=30,..."), see services/deadline.py
+ENDPOINT_DEADLINES = {
+    endpoint.strip(): float(seconds)
+    for endpoint, _, seconds in (pair.partition("=") for pair in os.getenv("ENDPOINT_DEADLINES", "chat=30").split(","))
+    if endpoint.strip() and seconds.strip()
+}
+## Longest the classifier may take out of it before routing falls back to keywords
+CLASSIFIER_TIMEOUT = float(os.getenv("CLASSIFIER_TIMEOUT", "8"))
+
+## Longest wait in seconds between retries of warm-up stages that failed at startup, see app.py
+WARMUP_RETRY_MAX_DELAY = float(os.getenv("WARMUP_RETRY_MAX_DELAY", "30"))
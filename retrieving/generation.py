@@ -1,10 +1,10 @@
-from langchain_openai import ChatOpenAI
-from langchain.chains.retrieval import create_retrieval_chain
 from langchain.chains.combine_documents import create_stuff_documents_chain
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import PromptTemplate
-from retrieval import load_FAISS_retriever
-from langchain_community.callbacks import get_openai_callback
+
+## Built once per worker by the startup warm-up (or the first RAG question)
+_stuff_chain = None
+_stuff_llm = None
 
 
 ######################################## PROMPT ########################################
@@ -30,7 +30,22 @@ def getRagPrompt():
     Question: {input}                              
     """)
 
+def get_stuff_chain(timeout=None):
+    global _stuff_chain, _stuff_llm
+    if _stuff_chain is None:
+        ## Retried by the request's Deadline.call, see generate_with_context
+        _stuff_llm = ChatOpenAI(model="gpt-4.1-nano", max_retries=0)
+        # This handles injecting context into prompt
+        _stuff_chain = create_stuff_documents_chain(llm=_stuff_llm, prompt=getRagPrompt())
+
+    ## Per-request timeout on the OpenAI call
+    if timeout is not None:
+        return create_stuff_documents_chain(llm=_stuff_llm.bind(timeout=timeout), prompt=getRagPrompt())
+    return _stuff_chain
+
 def generate(question, retriever):
+    from langchain.chains.retrieval import create_retrieval_chain
+
     llm = ChatOpenAI(model="gpt-4.1-nano")
 
     prompt = getRagPrompt()
@@ -65,8 +80,37 @@ def generate(question, retriever):
         }
 
 
+## Generates the answer from documents that were already retrieved, e.g. by an embedding computed upstream
+##   deadline: request budget (services/deadline.py), attempts are retried while it has time left
+def generate_with_context(question, docs, deadline):
+    print("\n\n ## RAG GENERATION LAYER: Question received:", question,"\n")
+
+    try:
+        answer = deadline.call(lambda timeout: get_stuff_chain(timeout).invoke({"input": question, "context": docs}))
+
+        print("\n\n ######## RAG Response ###### \n\n", answer, "\n\n")
+
+        return {
+            "status": "success",
+            "answer": answer,
+            "context": docs,
+            "error": None
+        }
+
+    except Exception as e:
+        print(f"❌ RAG pipeline error: {str(e)}")
+        return {
+            "status": "error",
+            "answer": None,
+            "context": docs,
+            "error": str(e)
+        }
+
+
 ## Helper function to get the token cost for the LLM call
 def helper_getCost(rag_chain, question):
+    from langchain_community.callbacks import get_openai_callback
+
     # Measure token usage and cost
     with get_openai_callback() as cb:
 
@@ -86,6 +130,8 @@ def helper_getCost(rag_chain, question):
 # ## Test code if running this python file
 # if __name__ == "__main__":
 
+#     from retrieval import load_FAISS_retriever
+
 #     print("\n processing ... \n")
 
 #     faiss_retriever = load_FAISS_retriever().as_retriever()
@@ -0,0 +1,139 @@
+"""
+Read-only serving format for the FAISS index, opened with mmap.
+
+Every uvicorn worker maps the same files, so the vectors and documents live once in
+the page cache instead of once per worker, and opening the index costs the same
+regardless of its size. Search is an exact L2 scan like FAISS IndexFlatL2 (the index
+type LangChain builds), so scores are the same squared L2 distances.
+
+Layout of an index folder:
+    manifest.json   build_id, count, dim, metric
+    vectors.npy     float32 (count, dim) embeddings
+    norms.npy       float32 (count,) squared L2 norm of each vector
+    offsets.npy     int64 (count + 1,) byte offset of each document in docs.jsonl
+    docs.jsonl      one {"page_content", "metadata"} object per line
+"""
+
+import json
+import mmap
+import os
+import shutil
+import time
+import uuid
+
+import numpy as np
+
+DEFAULT_PATH = "faiss_oracle_index_mmap"
+
+
+def save_mmap_index(folder, vectors, documents):
+    """
+    Writes vectors and their documents to `folder` in the mmap serving format.
+
+    The index is written next to the target and swapped in with a rename, so workers
+    that still have the previous build mapped keep reading it until they reopen.
+
+    Args:
+        folder (str): index folder to create or replace
+        vectors (array-like): (count, dim) embeddings, in the same order as documents
+        documents (list): (page_content, metadata) pairs
+
+    Returns:
+        manifest (dict)
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    if len(vectors) != len(documents):
+        raise ValueError(f"Got {len(vectors)} vectors for {len(documents)} documents")
+
+    folder = os.path.abspath(folder)
+    staging = f"{folder}.tmp-{uuid.uuid4().hex[:8]}"
+    os.makedirs(staging)
+
+    offsets = [0]
+    with open(os.path.join(staging, "docs.jsonl"), "wb") as f:
+        for page_content, metadata in documents:
+            line = json.dumps({"page_content": page_content, "metadata": metadata}, ensure_ascii=False)
+            f.write(line.encode("utf-8") + b"\n")
+            offsets.append(f.tell())
+
+    np.save(os.path.join(staging, "vectors.npy"), vectors)
+    np.save(os.path.join(staging, "norms.npy"), np.einsum("ij,ij->i", vectors, vectors))
+    np.save(os.path.join(staging, "offsets.npy"), np.asarray(offsets, dtype=np.int64))
+
+    manifest = {
+        "build_id": f"{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}",
+        "count": int(vectors.shape[0]),
+        "dim": int(vectors.shape[1]) if vectors.ndim == 2 else 0,
+        "metric": "l2",
+    }
+    with open(os.path.join(staging, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+    ## Swap the new build in, the old files stay valid for processes that have them mapped
+    previous = None
+    if os.path.exists(folder):
+        previous = f"{folder}.old-{uuid.uuid4().hex[:8]}"
+        os.rename(folder, previous)
+    os.rename(staging, folder)
+    if previous:
+        shutil.rmtree(previous, ignore_errors=True)
+
+    return manifest
+
+
+class MmapIndex:
+    """
+    Memory-mapped, read-only view of an index folder written by save_mmap_index.
+    """
+
+    def __init__(self, folder=DEFAULT_PATH):
+        self.folder = folder
+
+        with open(os.path.join(folder, "manifest.json"), "r", encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        self.build_id = self.manifest["build_id"]
+
+        self.vectors = np.load(os.path.join(folder, "vectors.npy"), mmap_mode="r")
+        self.norms = np.load(os.path.join(folder, "norms.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(folder, "offsets.npy"), mmap_mode="r")
+
+        self._docs = None
+        if len(self):
+            with open(os.path.join(folder, "docs.jsonl"), "rb") as f:
+                self._docs = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return self.manifest["count"]
+
+    def warm(self, rows_per_read=65536):
+        """
+        Reads the vectors once so they're in the page cache before the first search.
+        Only the first worker on a host actually reads from disk.
+        """
+        for start in range(0, len(self), rows_per_read):
+            self.vectors[start:start + rows_per_read].sum()
+
+    def search(self, query_vector, k=4):
+        """
+        Returns the k nearest (position, squared L2 distance) pairs, closest first.
+        """
+        k = min(k, len(self))
+        if k <= 0:
+            return []
+
+        query = np.asarray(query_vector, dtype=np.float32)
+
+        # ||x - q||^2 = ||x||^2 - 2 x.q + ||q||^2
+        distances = self.norms - 2.0 * (self.vectors @ query) + float(query @ query)
+
+        top = np.argpartition(distances, k - 1)[:k]
+        top = top[np.argsort(distances[top])]
+        return [(int(i), float(distances[i])) for i in top]
+
+    def document(self, position):
+        """
+        Returns (page_content, metadata) of the document at `position`.
+        """
+        start, end = int(self.offsets[position]), int(self.offsets[position + 1])
+        doc = json.loads(self._docs[start:end])
+        return doc["page_content"], doc["metadata"]
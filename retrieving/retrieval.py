@@ -1,24 +1,106 @@
-
-from langchain_community.vectorstores import FAISS
+from typing import Any, List, Optional, Tuple
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
 from langchain_openai import OpenAIEmbeddings
 from dotenv import load_dotenv
+from shards import ShardSet, read_manifest
 
 
 load_dotenv()
 
+## Loaded once per worker process, see load_FAISS_retriever
+_vectorstore = None
+
+
+"""
+Read-only LangChain vector store over the per-manual index shards (shards.py)
+
+Workers share the memory-mapped shards through the page cache, only the query embedding
+and the returned documents are allocated per worker. Searches take an optional
+`manuals` list of shard names to route the question to, all shards are searched otherwise.
+"""
+class ShardedVectorStore(VectorStore):
+
+    def __init__(self, shards: ShardSet, embedding: Embeddings):
+        self.shards = shards
+        self._embedding = embedding
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding
+
+    ## Changes whenever any shard is rebuilt
+    @property
+    def build_id(self) -> str:
+        return self.shards.build_id()
+
+    ## Changes only when one of the given shards is rebuilt
+    def build_id_of(self, names: List[str]) -> str:
+        return self.shards.build_id(names)
+
+    def select_shards(self, manuals: Optional[List[str]] = None) -> List[str]:
+        return self.shards.select(manuals)
+
+    def warm(self):
+        self.shards.warm()
+
+    def similarity_search_with_score_by_vector(
+        self, embedding: List[float], k: int = 4, manuals: Optional[List[str]] = None, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        return [
+            (Document(page_content=page_content, metadata=metadata), distance)
+            for page_content, metadata, distance in self.shards.search(embedding, k, manuals)
+        ]
+
+    def similarity_search_by_vector(
+        self, embedding: List[float], k: int = 4, manuals: Optional[List[str]] = None, **kwargs: Any
+    ) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k, manuals)]
+
+    def similarity_search_with_score(
+        self, query: str, k: int = 4, manuals: Optional[List[str]] = None, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(self._embedding.embed_query(query), k, manuals)
+
+    def similarity_search(
+        self, query: str, k: int = 4, manuals: Optional[List[str]] = None, **kwargs: Any
+    ) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, manuals)]
+
+    def add_texts(self, texts, metadatas: Optional[List[dict]] = None, **kwargs: Any) -> List[str]:
+        raise NotImplementedError("Index shards are read-only, rebuild them with Indexing/embeddings.py")
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, **kwargs: Any):
+        raise NotImplementedError("Build index shards with Indexing/embeddings.py")
+
 
 def load_FAISS_retriever():
+    global _vectorstore
+
+    if _vectorstore is not None:
+        return _vectorstore
+
     # Initialize embedding model (same as used before)
-    embedding_model = OpenAIEmbeddings()
+    ## Retried by the request's Deadline.call, see rag_pipeline.retrieve_context
+    embedding_model = OpenAIEmbeddings(max_retries=0)
+
+    ## Prefer the memory-mapped index shards, opening them doesn't depend on their size
+    if read_manifest():
+        _vectorstore = ShardedVectorStore(ShardSet(), embedding_model)
+        return _vectorstore
 
-    # Load FAISS index from local folder
-    vectorstore = FAISS.load_local(
+    # Load FAISS index from local folder (only needed without the serving index, so imported here)
+    from langchain_community.vectorstores import FAISS
+
+    _vectorstore = FAISS.load_local(
         folder_path="faiss_oracle_index",
         embeddings=embedding_model,
         allow_dangerous_deserialization=True
     )
 
-    return vectorstore
+    return _vectorstore
 
 def getTopKChunks(question, vectorstore, k):
 
@@ -31,7 +113,7 @@ def getTopKChunks(question, vectorstore, k):
         print("")
 
 
-    
+
 
 
 if __name__ == "__main__":
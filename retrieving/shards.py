@@ -0,0 +1,202 @@
+"""
+One index shard per manual (Payables, Receivables, GL, Purchasing, ...).
+
+Each shard is a memory-mapped index (mmap_index.py) in its own folder, listed in a
+manifest with the manual it was built from. A question is searched only in the shards
+of the manuals it was routed to, in parallel, and the per-shard top-k are merged by
+distance (every shard uses the same embedding model, so distances are comparable).
+Building or rebuilding a shard only rewrites that shard's folder and manifest entry.
+The first shard saved also registers the pre-shard single index (faiss_oracle_index_mmap/)
+as the "payables" shard, so adding a manual never drops the one that was already served.
+Shard names are lowercase, the classifier's routing answers are matched lowercased.
+
+Layout:
+    faiss_indexes/
+        manifest.json   {"shards": {name: {"manual", "path", "build_id", "count", "source"}}}
+        payables/       mmap index
+        receivables/    mmap index
+"""
+
+import heapq
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from mmap_index import MmapIndex, save_mmap_index, DEFAULT_PATH
+
+INDEX_ROOT = "faiss_indexes"
+MANIFEST = "manifest.json"
+
+## The single-manual index from before shards, served as one shard when there is no manifest
+DEFAULT_SHARD = "payables"
+DEFAULT_MANUAL = "Oracle Payables User's Guide, Release 12.2"
+
+_manifest_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="shard-search")
+
+
+def shard_name(name):
+    return name.strip().lower()
+
+
+def read_manifest(root=INDEX_ROOT):
+    path = os.path.join(root, MANIFEST)
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return {shard_name(name): entry for name, entry in json.load(f)["shards"].items()}
+
+    return _legacy_entries()
+
+
+## The single-manual index from before shards, as a manifest entry, if it exists
+def _legacy_entries():
+    if os.path.exists(os.path.join(DEFAULT_PATH, "manifest.json")):
+        with open(os.path.join(DEFAULT_PATH, "manifest.json"), "r", encoding="utf-8") as f:
+            build = json.load(f)
+        return {
+            DEFAULT_SHARD: {
+                "manual": DEFAULT_MANUAL,
+                "path": os.path.abspath(DEFAULT_PATH),
+                "build_id": build["build_id"],
+                "count": build["count"],
+            }
+        }
+
+    return {}
+
+
+## Manual names by shard, for routing prompts
+def list_manuals(root=INDEX_ROOT):
+    manuals = {name: entry["manual"] for name, entry in read_manifest(root).items()}
+    return manuals or {DEFAULT_SHARD: DEFAULT_MANUAL}
+
+
+def save_shard(name, manual, vectors, documents, source=None, root=INDEX_ROOT):
+    """
+    Writes one shard and records it in the manifest, leaving the other shards untouched.
+
+    Args:
+        name (str): shard name used for routing, e.g. "receivables" (stored lowercase)
+        manual (str): full manual title shown to the classifier
+        vectors, documents: see mmap_index.save_mmap_index
+
+    Returns:
+        the shard's manifest entry (dict)
+    """
+    name = shard_name(name)
+    os.makedirs(root, exist_ok=True)
+    build = save_mmap_index(os.path.join(root, name), vectors, documents)
+
+    entry = {
+        "manual": manual,
+        "path": name,
+        "build_id": build["build_id"],
+        "count": build["count"],
+        "source": source,
+    }
+
+    with _manifest_lock:
+        path = os.path.join(root, MANIFEST)
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                shards = {shard_name(shard): e for shard, e in json.load(f)["shards"].items()}
+        else:
+            ## First shard: keep serving the pre-shard index next to it
+            shards = _legacy_entries()
+            if shards:
+                print(f"Registering the existing index {DEFAULT_PATH}/ as shard '{DEFAULT_SHARD}'")
+        shards[name] = entry
+
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"shards": shards}, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    return entry
+
+
+class ShardSet:
+    """
+    The open shards of an index root. Shards whose build changed in the manifest are
+    reopened on the next search, the others keep their mappings.
+    """
+
+    def __init__(self, root=INDEX_ROOT):
+        self.root = root
+        self.indexes = {}
+        self.manuals = {}
+        self._manifest_mtime = None
+        self._lock = threading.Lock()
+        self.refresh(force=True)
+
+    def refresh(self, force=False):
+        path = os.path.join(self.root, MANIFEST)
+        mtime = os.path.getmtime(path) if os.path.exists(path) else None
+        if not force and mtime == self._manifest_mtime:
+            return
+
+        with self._lock:
+            entries = read_manifest(self.root)
+            indexes = {}
+            for name, entry in entries.items():
+                current = self.indexes.get(name)
+                if current is not None and current.build_id == entry["build_id"]:
+                    indexes[name] = current
+                else:
+                    indexes[name] = MmapIndex(os.path.join(self.root, entry["path"]))
+
+            ## Swapped in whole, so searches in flight keep a consistent set of shards
+            self.indexes = indexes
+            self.manuals = {name: entry["manual"] for name, entry in entries.items()}
+            self._manifest_mtime = mtime
+
+    def __len__(self):
+        return sum(len(index) for index in self.indexes.values())
+
+    def select(self, manuals=None, indexes=None):
+        """
+        Shard names to search for the requested manuals, all shards if none of them match.
+        """
+        indexes = self.indexes if indexes is None else indexes
+        names = sorted(name for name in (manuals or []) if name in indexes)
+        return names or sorted(indexes)
+
+    def build_id(self, names=None):
+        """
+        Build id of the given shards (all by default), changes when any of them is rebuilt.
+        """
+        indexes = self.indexes
+        return "|".join(
+            f"{name}:{indexes[name].build_id if name in indexes else 'missing'}" for name in (names or sorted(indexes))
+        )
+
+    def warm(self):
+        for index in self.indexes.values():
+            index.warm()
+
+    def search(self, query_vector, k=4, manuals=None):
+        """
+        Returns the k nearest (page_content, metadata, distance) over the selected shards, closest first.
+        """
+        self.refresh()
+        indexes = self.indexes
+        names = self.select(manuals, indexes)
+
+        if len(names) == 1:
+            per_shard = [indexes[names[0]].search(query_vector, k)]
+        else:
+            per_shard = list(_executor.map(lambda name: indexes[name].search(query_vector, k), names))
+
+        hits = heapq.nsmallest(k, (
+            (distance, name, position)
+            for name, results in zip(names, per_shard)
+            for position, distance in results
+        ))
+
+        results = []
+        for distance, name, position in hits:
+            page_content, metadata = indexes[name].document(position)
+            metadata.setdefault("manual", name)
+            results.append((page_content, metadata, distance))
+        return results
@@ -0,0 +1,342 @@
+"""
+Precomputed summary tables for the common analytics questions.
+
+Most SQL questions are totals/counts over purchase_order and invoices grouped by
+vendor, status or month. Those are answered from small summary tables that are
+refreshed incrementally from `created_at`, instead of a full GROUP BY over the
+base tables on every question.
+
+Build / refresh (run from the project root, e.g. from cron):
+    python -m services.aggregates          # incremental, rows created since last refresh
+    python -m services.aggregates --full   # rebuild from scratch
+
+The incremental refresh only sees newly created rows. Status changes or deletes
+on existing rows are picked up by the next full rebuild. Because Status changes all the
+time (Pending -> Paid), queries that filter or group by Status are only answered from a
+summary whose last full rebuild is at most SUMMARY_STATUS_MAX_AGE seconds old (0, the
+default, never routes them); everything else reads the base tables.
+"""
+
+import re
+import datetime
+
+
+## One summary table per base table, grouped by the listed dimensions and the month of date_column
+SUMMARY_TABLES = {
+    "purchase_order": {
+        "summary": "purchase_order_summary",
+        "date_column": "Date",
+        "dimensions": ["Vendor_Name", "Status"],
+        ## Dimensions that change on existing rows, only trusted right after a full rebuild
+        "mutable": ["Status"],
+        "count_column": "order_count",
+        "sums": {"Total_Price": "total_price"},
+    },
+    "invoices": {
+        "summary": "invoices_summary",
+        "date_column": "Invoice_Date",
+        "dimensions": ["Status"],
+        "mutable": ["Status"],
+        "count_column": "invoice_count",
+        "sums": {"Total_Price": "total_price", "Quantity": "total_quantity"},
+    },
+}
+
+STATE_TABLE = "summary_refresh_state"
+MONTH_COLUMN = "Month"
+
+
+######################################## REFRESH ########################################
+
+def create_summary_tables(cursor):
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {STATE_TABLE} (
+            table_name VARCHAR(64) PRIMARY KEY,
+            last_created_at DATETIME NOT NULL,
+            last_full_refresh DATETIME NULL
+        )""")
+    ## State tables created before full rebuilds were tracked
+    cursor.execute(f"SHOW COLUMNS FROM {STATE_TABLE} LIKE 'last_full_refresh'")
+    if not cursor.fetchall():
+        cursor.execute(f"ALTER TABLE {STATE_TABLE} ADD COLUMN last_full_refresh DATETIME NULL")
+
+    for base, spec in SUMMARY_TABLES.items():
+        cursor.execute(f"SHOW COLUMNS FROM {base}")
+        column_types = {
+            row[0]: row[1].decode() if isinstance(row[1], bytes) else row[1]
+            for row in cursor.fetchall()
+        }
+
+        dimensions = ",\n".join(f"{dim} {column_types[dim]} NOT NULL" for dim in spec["dimensions"])
+        sums = ",\n".join(f"{target} DECIMAL(20,2) NOT NULL" for target in spec["sums"].values())
+        keys = ", ".join(spec["dimensions"] + [MONTH_COLUMN])
+
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {spec['summary']} (
+                {dimensions},
+                {MONTH_COLUMN} CHAR(7) NOT NULL,
+                {spec['count_column']} BIGINT NOT NULL,
+                {sums},
+                PRIMARY KEY ({keys})
+            )""")
+
+
+def refresh_summary_table(cursor, base, full=False):
+    spec = SUMMARY_TABLES[base]
+    summary = spec["summary"]
+
+    if full:
+        cursor.execute(f"DELETE FROM {summary}")
+        cursor.execute(f"DELETE FROM {STATE_TABLE} WHERE table_name = %s", (summary,))
+
+    cursor.execute(f"SELECT last_created_at FROM {STATE_TABLE} WHERE table_name = %s", (summary,))
+    row = cursor.fetchone()
+    since = row[0] if row else datetime.datetime(1970, 1, 1)
+
+    ## Stop one second short of now so rows still being inserted in the current second are
+    ## picked up by the next refresh instead of being skipped by the watermark
+    cursor.execute("SELECT NOW() - INTERVAL 1 SECOND")
+    until = cursor.fetchone()[0]
+    if until <= since and not full:
+        return 0
+
+    dimensions = ", ".join(spec["dimensions"])
+    month = f"DATE_FORMAT({spec['date_column']}, '%%Y-%%m')"
+    sum_targets = ", ".join(spec["sums"].values())
+    sum_exprs = ", ".join(f"SUM({source})" for source in spec["sums"])
+    updates = ", ".join(
+        f"{target} = {target} + VALUES({target})"
+        for target in [spec["count_column"], *spec["sums"].values()]
+    )
+
+    cursor.execute(f"""
+        INSERT INTO {summary} ({dimensions}, {MONTH_COLUMN}, {spec['count_column']}, {sum_targets})
+        SELECT {dimensions}, {month}, COUNT(*), {sum_exprs}
+        FROM {base}
+        WHERE created_at > %s AND created_at <= %s
+        GROUP BY {dimensions}, {month}
+        ON DUPLICATE KEY UPDATE {updates}""", (since, until))
+    changed = cursor.rowcount
+
+    if full:
+        cursor.execute(f"""
+            INSERT INTO {STATE_TABLE} (table_name, last_created_at, last_full_refresh) VALUES (%s, %s, %s)""",
+            (summary, until, until))
+    else:
+        cursor.execute(f"""
+            INSERT INTO {STATE_TABLE} (table_name, last_created_at) VALUES (%s, %s)
+            ON DUPLICATE KEY UPDATE last_created_at = VALUES(last_created_at)""", (summary, until))
+
+    return changed
+
+
+def refresh_summary_tables(full=False):
+    from services.sql_generator import create_connection
+
+    conn = create_connection()
+    if not conn:
+        raise RuntimeError("Database connection failed")
+
+    try:
+        cursor = conn.cursor()
+        create_summary_tables(cursor)
+        for base in SUMMARY_TABLES:
+            ## Summary rows and the watermark are committed together so a failed refresh is retried as a whole
+            changed = refresh_summary_table(cursor, base, full=full)
+            conn.commit()
+            print(f"✅ Refreshed {SUMMARY_TABLES[base]['summary']} ({changed} rows changed)")
+        cursor.close()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+## True once the summary table has been refreshed at least once, otherwise it would answer with empty totals.
+## With mutable=True (the query uses Status) the last full rebuild must also be at most max_age seconds old.
+def summary_is_built(cursor, summary, mutable=False, max_age=0):
+    if mutable and max_age <= 0:
+        return False
+    try:
+        if mutable:
+            cursor.execute(
+                f"SELECT 1 FROM {STATE_TABLE} WHERE table_name = %s "
+                f"AND last_full_refresh >= NOW() - INTERVAL %s SECOND", (summary, max_age))
+        else:
+            cursor.execute(f"SELECT 1 FROM {STATE_TABLE} WHERE table_name = %s", (summary,))
+        return bool(cursor.fetchall())
+    except Exception:
+        return False
+
+
+######################################## ROUTER ########################################
+
+_QUERY_PATTERN = re.compile(
+    r"^SELECT\s+(?P<select>.+?)"
+    r"\s+FROM\s+`?(?P<table>\w+)`?"
+    r"(?:\s+WHERE\s+(?P<where>.+?))?"
+    r"(?:\s+GROUP\s+BY\s+(?P<group>.+?))?"
+    r"(?:\s+ORDER\s+BY\s+(?P<order>.+?))?"
+    r"(?:\s+LIMIT\s+(?P<limit>\d+))?"
+    r"\s*;?$",
+    re.IGNORECASE | re.DOTALL,
+)
+_UNSUPPORTED = re.compile(r"\b(JOIN|UNION|HAVING|OR|SELECT\s+DISTINCT|WITH)\b|\(\s*SELECT", re.IGNORECASE)
+_ALIAS = re.compile(r"^(?P<expr>.+?)(?:\s+AS)?\s+`?(?P<alias>\w+)`?$", re.IGNORECASE | re.DOTALL)
+_AGGREGATE = re.compile(r"^(?P<func>COUNT|SUM|AVG)\s*\(\s*`?(?P<arg>\*|\w+)`?\s*\)$", re.IGNORECASE)
+_CONDITION = re.compile(r"^`?(?P<column>\w+)`?\s*=\s*(?P<value>'[^'\\]*')$")
+_MONTH = r"(?i:DATE_FORMAT)\(\s*`?(?i:{column})`?\s*,\s*'%Y-%m'\s*\)"
+
+
+def _split_top_level(text, separator=","):
+    parts, depth, quoted, current = [], 0, False, ""
+    for char in text:
+        if char == "'":
+            quoted = not quoted
+        elif not quoted and char == "(":
+            depth += 1
+        elif not quoted and char == ")":
+            depth -= 1
+        if char == separator and depth == 0 and not quoted:
+            parts.append(current.strip())
+            current = ""
+        else:
+            current += char
+    parts.append(current.strip())
+    return parts
+
+
+## Maps a select/group-by expression onto a summary dimension, or None if it isn't one
+def _dimension(expr, spec):
+    name = expr.strip("`")
+    for dim in spec["dimensions"]:
+        if name.lower() == dim.lower():
+            return dim
+    if re.fullmatch(_MONTH.format(column=spec["date_column"]), expr):
+        return MONTH_COLUMN
+    return None
+
+
+## Rewrites COUNT/SUM/AVG over the base table into the equivalent expression over the summary table
+def _aggregate(expr, spec, grouped):
+    match = _AGGREGATE.match(expr)
+    if not match:
+        return None
+    func, arg = match.group("func").upper(), match.group("arg")
+    count = f"SUM({spec['count_column']})"
+    sums = {source.lower(): target for source, target in spec["sums"].items()}
+
+    if func == "COUNT" and arg in ("*", "1", "id"):
+        ## COUNT never returns NULL, SUM over zero summary rows does
+        return f"CAST({count} AS SIGNED)" if grouped else f"CAST(COALESCE({count}, 0) AS SIGNED)"
+    if func == "SUM" and arg.lower() in sums:
+        return f"SUM({sums[arg.lower()]})"
+    if func == "AVG" and arg.lower() in sums:
+        return f"SUM({sums[arg.lower()]}) / {count}"
+    return None
+
+
+def route_to_summary(sql_query):
+    """
+    Rewrites a generated aggregate query to read from a summary table.
+
+    Args:
+        sql_query (str): SQL generated for the user's question
+
+    Returns:
+        (summary table name, rewritten SQL, True if it filters or groups by a mutable
+        dimension such as Status), or None when the query can't be answered exactly
+        from a summary table and must run against the base tables
+    """
+    sql = " ".join(sql_query.split())
+    match = _QUERY_PATTERN.match(sql)
+    if not match or _UNSUPPORTED.search(sql):
+        return None
+
+    spec = SUMMARY_TABLES.get(match.group("table").lower())
+    if not spec:
+        return None
+
+    grouped = bool(match.group("group"))
+    rewritten = {}  # original expression -> summary expression, used for ORDER BY
+    aliases = {}  # alias of a dimension -> dimension, used for GROUP BY
+    select, select_dims, has_aggregate = [], set(), False
+
+    for item in _split_top_level(match.group("select")):
+        expr, alias = item, None
+        aliased = _ALIAS.match(item)
+        if aliased and not _AGGREGATE.match(item) and not _dimension(item, spec):
+            expr, alias = aliased.group("expr").strip(), aliased.group("alias")
+
+        dim = _dimension(expr, spec)
+        if dim:
+            select_dims.add(dim)
+            target = dim
+        else:
+            target = _aggregate(expr, spec, grouped)
+            if not target:
+                return None
+            has_aggregate = True
+
+        ## Keep the column names the base query would have returned
+        select.append(f"{target} AS `{alias or expr}`")
+        rewritten[expr.lower()] = target
+        if alias:
+            rewritten[alias.lower()] = f"`{alias}`"
+            if dim:
+                aliases[alias.lower()] = dim
+
+    if not has_aggregate:
+        return None
+
+    group_dims = set()
+    if grouped:
+        for item in _split_top_level(match.group("group")):
+            dim = _dimension(item, spec) or aliases.get(item.strip("`").lower())
+            if not dim:
+                return None
+            group_dims.add(dim)
+    if group_dims != select_dims:
+        return None
+
+    conditions, filter_dims = [], set()
+    if match.group("where"):
+        for condition in re.split(r"\s+AND\s+", match.group("where"), flags=re.IGNORECASE):
+            cond = _CONDITION.match(condition.strip())
+            dim = cond and _dimension(cond.group("column"), spec)
+            if not dim or dim == MONTH_COLUMN:
+                return None
+            conditions.append(f"{dim} = {cond.group('value')}")
+            filter_dims.add(dim)
+
+    order = []
+    if match.group("order"):
+        for item in _split_top_level(match.group("order")):
+            parts = item.rsplit(None, 1)
+            direction = ""
+            if len(parts) == 2 and parts[1].upper() in ("ASC", "DESC"):
+                item, direction = parts[0], " " + parts[1].upper()
+            target = rewritten.get(item.lower()) or _dimension(item, spec)
+            if not target:
+                return None
+            order.append(target + direction)
+
+    routed = f"SELECT {', '.join(select)} FROM {spec['summary']}"
+    if conditions:
+        routed += " WHERE " + " AND ".join(conditions)
+    if grouped:
+        routed += " GROUP BY " + ", ".join(sorted(group_dims))
+    if order:
+        routed += " ORDER BY " + ", ".join(order)
+    if match.group("limit"):
+        routed += " LIMIT " + match.group("limit")
+
+    mutable = bool((group_dims | filter_dims) & set(spec.get("mutable", [])))
+    return spec["summary"], routed, mutable
+
+
+if __name__ == "__main__":
+    import sys
+
+    refresh_summary_tables(full="--full" in sys.argv)
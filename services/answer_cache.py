@@ -0,0 +1,214 @@
+import atexit
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: saves from concurrent worker processes aren't serialized
+    fcntl = None
+
+
+"""
+Semantic cache of final RAG answers
+
+Entries are keyed by the question's embedding and served for any later question whose
+embedding has a cosine similarity of at least `threshold`, so rewordings of the same
+how-to question skip retrieval and generation. Entries carry a scope (the manuals the
+question was routed to) and the build id of those manuals' index shards, and only match
+lookups with the same scope and build: rebuilding one manual's shard retires the answers
+that were drawn from it, answers scoped to other manuals stay.
+
+The cache holds at most `max_entries` answers and evicts the least recently used one.
+It is spilled to `path` every `flush_every` new answers and at exit, and loaded back on
+start, so it stays warm across restarts. Every worker process spills to the same file:
+a save merges with the answers already in it (under a file lock) instead of replacing
+them, keeping the `max_entries` most recently used across all workers.
+"""
+class SemanticAnswerCache:
+
+    def __init__(self, path=None, max_entries=1000, threshold=0.95, flush_every=20):
+        self.path = path
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.flush_every = flush_every
+
+        self._vectors = None  # (max_entries, dim), one row per slot
+        self._used = np.zeros(max_entries, dtype=bool)
+        self._keys = [None] * max_entries  # (scope, build_id) per slot
+        self._entries = OrderedDict()  # slot -> entry, least recently used first
+        self._unsaved = 0
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()  # one save at a time, see save
+
+        if path:
+            self.load()
+            atexit.register(self.save)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _clear(self):
+        self._used[:] = False
+        self._entries.clear()
+
+    def _drop(self, slot):
+        self._used[slot] = False
+        self._keys[slot] = None
+        del self._entries[slot]
+
+    @staticmethod
+    def _normalize(embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, embedding, build_id, scope=None):
+        """
+        Returns the cached entry {question, answer, context} closest to `embedding`,
+        or None when nothing for this scope and index build is similar enough.
+        """
+        with self._lock:
+            if not self._entries:
+                return None
+
+            similarities = self._vectors @ self._normalize(embedding)
+            similarities[~self._used] = -np.inf
+            for slot in self._entries:
+                if self._keys[slot] != (scope, build_id):
+                    similarities[slot] = -np.inf
+            slot = int(np.argmax(similarities))
+            if similarities[slot] < self.threshold:
+                return None
+
+            self._entries.move_to_end(slot)
+            self._entries[slot]["used_at"] = time.time()
+            return self._entries[slot]
+
+    def put(self, embedding, build_id, question, answer, context, scope=None):
+        """
+        Stores an answer and its context pages ([{page_content, metadata}]) for a question embedding.
+        Answers for the same scope from older builds are dropped.
+        """
+        vector = self._normalize(embedding)
+
+        with self._lock:
+            if self._vectors is None or self._vectors.shape[1] != vector.shape[0]:
+                self._vectors = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+                self._clear()
+
+            for slot in [s for s in self._entries if self._keys[s][0] == scope and self._keys[s][1] != build_id]:
+                self._drop(slot)
+
+            if len(self._entries) >= self.max_entries:
+                slot, _ = self._entries.popitem(last=False)
+            else:
+                slot = int(np.argmin(self._used))
+
+            self._vectors[slot] = vector
+            self._used[slot] = True
+            self._keys[slot] = (scope, build_id)
+            self._entries[slot] = {
+                "question": question, "answer": answer, "context": context, "scope": scope, "build_id": build_id,
+                "used_at": time.time()
+            }
+            self._unsaved += 1
+            flush = self.path and self._unsaved >= self.flush_every
+
+        if flush:
+            self.save()
+
+    @staticmethod
+    def _entry_key(entry):
+        return entry["question"], entry.get("scope"), entry.get("build_id")
+
+    def _read(self):
+        """
+        Returns (vectors, entries) from the spill file, least recently used first, or None.
+        """
+        if not os.path.exists(self.path):
+            return None
+
+        try:
+            with np.load(self.path) as data:
+                vectors = data["vectors"]
+                meta = json.loads(str(data["meta"]))
+        except Exception as e:
+            print(f"Ignoring unreadable answer cache {self.path}: {str(e)}")
+            return None
+
+        entries = meta["entries"]
+        for entry in entries:
+            ## Spill files from before per-entry builds have one build id for all entries
+            entry.setdefault("build_id", meta.get("build_id"))
+            entry.setdefault("used_at", 0)
+        return vectors, entries
+
+    def _lock_file(self):
+        """
+        Opens and locks `path`.lock, serializing spills across worker processes. Closing it releases the lock.
+        """
+        lock_file = open(f"{self.path}.lock", "a")
+        if fcntl:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        return lock_file
+
+    def save(self):
+        if not self.path:
+            return
+
+        with self._save_lock, self._lock_file():
+            with self._lock:
+                slots = list(self._entries)
+                vectors = list(self._vectors[slots]) if slots else []
+                entries = [dict(self._entries[s]) for s in slots]
+                self._unsaved = 0
+
+            ## Keep what other workers spilled, this worker's copy wins for the same question
+            ## and answers from other builds of the scopes it holds are dropped, as in put
+            disk = self._read()
+            if disk:
+                dim = vectors[0].shape[0] if vectors else None
+                ours = {self._entry_key(entry) for entry in entries}
+                builds = {entry.get("scope"): entry.get("build_id") for entry in entries}
+                for vector, entry in zip(*disk):
+                    stale = builds.get(entry.get("scope"), entry.get("build_id")) != entry.get("build_id")
+                    if self._entry_key(entry) not in ours and not stale and (dim is None or vector.shape[0] == dim):
+                        vectors.append(vector)
+                        entries.append(entry)
+
+            order = sorted(range(len(entries)), key=lambda i: entries[i]["used_at"])[-self.max_entries:]
+            vectors = np.stack([vectors[i] for i in order]) if order else np.zeros((0, 0), dtype=np.float32)
+            meta = json.dumps({"entries": [entries[i] for i in order]})
+
+            ## Write then rename, so a crash mid-write never leaves a truncated spill file
+            tmp_path = f"{self.path}.tmp-{uuid.uuid4().hex[:8]}"
+            with open(tmp_path, "wb") as f:
+                np.savez(f, vectors=vectors, meta=np.array(meta))
+            os.replace(tmp_path, self.path)
+
+    def load(self):
+        disk = self._read()
+        if not disk:
+            return
+        vectors, entries = disk
+
+        with self._lock:
+            self._clear()
+            ## Oldest first, so the most recently used entries survive if max_entries shrank
+            entries = entries[-self.max_entries:]
+            vectors = vectors[len(vectors) - len(entries):]
+            if len(entries):
+                self._vectors = np.zeros((self.max_entries, vectors.shape[1]), dtype=np.float32)
+            for slot, (vector, entry) in enumerate(zip(vectors, entries)):
+                self._vectors[slot] = vector
+                self._used[slot] = True
+                self._keys[slot] = (entry.get("scope"), entry["build_id"])
+                self._entries[slot] = entry
+
+        print(f"Loaded {len(entries)} cached answers")
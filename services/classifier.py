@@ -1,7 +1,20 @@
-from langchain.prompts import PromptTemplate
+from langchain_core.prompts import PromptTemplate
 from langchain.output_parsers import StructuredOutputParser, ResponseSchema
 # from langchain.chains import LLMChain
 from langchain_openai import ChatOpenAI
+import re
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..','retrieving')))
+from shards import list_manuals # type: ignore
+from services.deadline import Deadline
+
+## Built once per worker by the startup warm-up (or the first question),
+## and again when the list of manuals changes
+_classifier_chain = None
+_classifier_manuals = None
+_classifier_parts = None  # (prompt, llm, output_parser), to bind a per-request timeout to the llm
 
 ## Defining the structure of output
 def structer_output():
@@ -18,8 +31,15 @@ def structer_output():
             If the question is already clear and complete, return it exactly as it is."""
     )
 
+    manuals_schema = ResponseSchema(
+        name="manuals",
+        description="""For "rag" questions only: comma-separated names (the part before the colon) of the
+            manuals from the list above that can answer the question, or "all" if unsure.
+            Return "all" for "sql" and "invalid" questions."""
+    )
+
     output_parser = StructuredOutputParser.from_response_schemas(
-        [classification_schema, rewritten_schema]
+        [classification_schema, rewritten_schema, manuals_schema]
     )
 
     return output_parser
@@ -33,7 +53,8 @@ def getPrompt():
         - purchase_order(id, PO_Number, Date, Vendor_Name, Total_Price, Status, created_at)
         - invoices(id, Invoice_Number, Invoice_Date, Purchase_Order, Item_Description, Quantity, Unit_Price, Total_Price, Due_Date, Status, created_at)
 
-        2. A **user manual**: *Oracle Payables User’s Guide for Release 12.2*, which covers topics related to using Oracle Payables within Oracle E-Business Suite.
+        2. **User manuals** for Oracle E-Business Suite, which cover topics related to using these products:
+        {manuals}
 
         Your task is two-fold:
         1. **Classify** the question as one of:
@@ -55,38 +76,70 @@ def getPrompt():
                                         
         """)
 
-## Making the LLM call to classify the strategy based on the question and chat history
-def classify_strat(user_question, chat_history):
-    try:
+def get_classifier_chain(timeout=None):
+    global _classifier_chain, _classifier_manuals, _classifier_parts
+
+    manuals = list_manuals()
+    if _classifier_chain is None or manuals != _classifier_manuals:
         ## Initiallizing the output structure and prompt
         output_parser = structer_output()
         prompt = getPrompt()
 
         ## Coupling the output structure and prompt
-        prompt = prompt.partial(format_instructions = output_parser.get_format_instructions())
-
-        ## Making the llm call
-        llm = ChatOpenAI(model="gpt-4o")
-        combined_chain = prompt | llm | output_parser
+        prompt = prompt.partial(
+            format_instructions = output_parser.get_format_instructions(),
+            manuals = "\n        ".join(f"- {name}: {title}" for name, title in manuals.items())
+        )
+
+        ## Retried by Deadline.call in classify_strat, within the request's budget
+        llm = ChatOpenAI(model="gpt-4o", max_retries=0)
+        _classifier_chain = prompt | llm | output_parser
+        _classifier_manuals = manuals
+        _classifier_parts = (prompt, llm, output_parser)
+
+    if timeout is not None:
+        prompt, llm, output_parser = _classifier_parts
+        return prompt | llm.bind(timeout=timeout) | output_parser
+    return _classifier_chain
 
+## Making the LLM call to classify the strategy based on the question and chat history
+##   deadline: request budget (services/deadline.py), raises DeadlineExceeded when it runs out
+def classify_strat(user_question, chat_history, deadline=None):
+    deadline = deadline or Deadline()
+    try:
         print("\n\n ## Classification Layer:  Question recieved", user_question,"\n")
         
-        # Invoke the chain
-        response = combined_chain.invoke({
+        ## Making the llm call, each attempt bounded by what is left of the deadline
+        response = deadline.call(lambda timeout: get_classifier_chain(timeout).invoke({
             "history": chat_history,
             "question": user_question
-        })
+        }))
 
         ## Returns a json file with {classification, rewritten_question}
         return response
     
     except Exception as e:
+        if deadline.expired():
+            raise deadline.timed_out("classification")
         return {
             "message": "Error while classifying the strategy based on question",
             "error": str(e)
         }
 
 
+## Keyword routing for when the classifier runs out of time: no rewrite, all manuals
+SQL_WORDS = re.compile(r"\b(invoices?|purchase orders?|orders?|vendors?|suppliers?|how many|count|total|sum|average|pending|overdue|paid|approved)\b", re.IGNORECASE)
+HOW_TO_WORDS = re.compile(r"\b(how (do|can|to|should)|what is an?|what are|define|explain|steps?|set ?up|configure|difference)\b", re.IGNORECASE)
+
+def fallback_classification(user_question):
+    is_sql = SQL_WORDS.search(user_question) and not HOW_TO_WORDS.search(user_question)
+    return {
+        "classification": "sql" if is_sql else "rag",
+        "rewritten_question": "N/A",
+        "manuals": "all"
+    }
+
+
 ## Test code if running this python file
 if __name__ == "__main__":
     chat_history = """
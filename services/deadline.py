@@ -0,0 +1,107 @@
+import asyncio
+import time
+
+
+"""
+Per-request time budget
+
+A Deadline is created when a request comes in (see ENDPOINT_DEADLINES in config.py) and
+passed down to every stage. Each stage gets what is left of the budget: blocking stages run
+in a worker thread bounded by the remaining time, and their network calls (OpenAI, MySQL)
+get it as their own timeout, so the thread also stops shortly after the request gave up on it.
+Stages that ran out of time are listed in `timeouts` and reported in the response metadata.
+
+OpenAI calls go through Deadline.call instead of the client's own retries: every attempt
+gets the remaining budget as its timeout, and a failed attempt is only retried when there
+is still time for another one, so retries never outlive the request.
+"""
+## Seconds an attempt needs at least, a retry isn't started with less than this left
+MIN_ATTEMPT_SECONDS = 1.0
+
+
+## Same rule as the OpenAI client: connection errors, timeouts, 408, 409, 429 and 5xx
+def is_retryable(error):
+    status = getattr(error, "status_code", None)
+    if isinstance(status, int):
+        return status in (408, 409, 429) or status >= 500
+    return type(error).__name__ in ("APIConnectionError", "APITimeoutError")
+
+
+class DeadlineExceeded(Exception):
+
+    def __init__(self, stage):
+        super().__init__(f"Deadline exceeded during {stage}")
+        self.stage = stage
+
+
+class Deadline:
+
+    def __init__(self, seconds=None):
+        ## None never expires
+        self.seconds = seconds
+        self.expires_at = None if seconds is None else time.monotonic() + seconds
+        self.timeouts = []
+
+    def remaining(self):
+        """
+        Seconds left, or None without a deadline.
+        """
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def within(self, seconds):
+        """
+        Deadline for a single stage: `seconds` from now, but never later than this one.
+        Timeouts are recorded on this deadline too.
+        """
+        stage = Deadline(seconds)
+        if self.expires_at is not None and (stage.expires_at is None or self.expires_at < stage.expires_at):
+            stage.expires_at = self.expires_at
+        stage.timeouts = self.timeouts
+        return stage
+
+    def expired(self):
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
+
+    def call(self, func, retries=2, backoff=0.5):
+        """
+        Calls func(timeout) with the remaining budget as timeout (None without a deadline).
+        Retryable errors are retried up to `retries` times with exponential backoff, as long
+        as the budget still has room for the wait and another attempt.
+        """
+        delay = backoff
+        for attempt in range(retries + 1):
+            try:
+                return func(self.remaining())
+            except Exception as e:
+                remaining = self.remaining()
+                out_of_time = remaining is not None and remaining < delay + MIN_ATTEMPT_SECONDS
+                if attempt == retries or out_of_time or not is_retryable(e):
+                    raise
+                print(f"Retrying in {delay}s after: {str(e)}")
+                time.sleep(delay)
+                delay *= 2
+
+    def timed_out(self, stage):
+        """
+        Records that `stage` ran out of time and returns the exception to raise.
+        """
+        if stage not in self.timeouts:
+            self.timeouts.append(stage)
+        return DeadlineExceeded(stage)
+
+    async def run(self, stage, func, *args, **kwargs):
+        """
+        Runs a blocking stage in a worker thread and waits at most the remaining budget.
+
+        Raises:
+            DeadlineExceeded: the budget ran out before or during the stage
+        """
+        remaining = self.remaining()
+        if remaining is not None and remaining <= 0:
+            raise self.timed_out(stage)
+        try:
+            return await asyncio.wait_for(asyncio.to_thread(func, *args, **kwargs), remaining)
+        except asyncio.TimeoutError:
+            raise self.timed_out(stage)
@@ -1,10 +1,12 @@
 
 
 from models.response_model import ChatResponse, MetaData
-from services.classifier import classify_strat
-from services.sql_generator import generate_sql_response
-from services.rag_pipeline import get_rag_response
-import json
+from services.classifier import classify_strat, fallback_classification, get_classifier_chain
+from services.deadline import Deadline, DeadlineExceeded
+from services.sql_generator import generate_sql_response, get_connection_pool, get_openai_client
+from services.sql_templates import answer_from_template
+from config import CLASSIFIER_TIMEOUT, SQL_TEMPLATES_ENABLED
+from services.rag_pipeline import answer_with_context, retrieve_context, load_FAISS_retriever, get_stuff_chain
 
 def format_history(history_list):
     return "\n".join([
@@ -12,17 +14,65 @@ def format_history(history_list):
         for m in history_list
     ])
 
+## Manuals picked by the classifier ("payables, receivables" or "all") as a list of shard names
+def parse_manuals(manuals):
+    names = [name.strip().lower() for name in str(manuals).split(",")]
+    names = [name for name in names if name and name not in ("all", "n/a", "none")]
+    return names or None
+
+## Returned when a stage ran out of the request's time and there is nothing to fall back to
+def timeout_response(source:str, question:str):
+    return ChatResponse(
+        status="error",
+        source=source,
+        message="The request ran out of time",
+        bot_response="Sorry, this is taking longer than expected, please try again in a moment",
+        meta=MetaData(
+            rewritten_query=question,
+            raw_error="Deadline exceeded"
+        )
+    )
+
 #####  Main function to process user input and route accordingly 
-async def handle_user_input(question: str, chat_history: str):
+##   deadline: time budget of the request (services/deadline.py), no limit when None.
+##   Stages that ran out of it are listed in meta.timeouts
+async def handle_user_input(question: str, chat_history: str, response_format: str = "rows", deadline: Deadline = None):
+    deadline = deadline or Deadline()
+
+    response = await route_question(question, chat_history, response_format, deadline)
+    response.meta.timeouts = list(deadline.timeouts)
+    return response
+
+
+async def route_question(question: str, chat_history: str, response_format: str, deadline: Deadline):
+
+    ## Common SQL questions are answered from a template, without classification or generation
+    if SQL_TEMPLATES_ENABLED:
+        try:
+            templated = await deadline.run("sql_execution", answer_from_template, question, deadline)
+        except DeadlineExceeded:
+            return timeout_response("SQL", question)
+        if templated:
+            return process_sql_generator(question, response_format, response=templated)
 
     ## Format chat history from list to string
     formatted_chat_history = format_history(chat_history)
 
-    ## Get the classification and rewritten querry
-    classification_response = classify_strat(question, formatted_chat_history)
+    ## Get the classification and rewritten querry, within its own share of the budget
+    classifier_deadline = deadline.within(CLASSIFIER_TIMEOUT)
+    try:
+        classification_response = await classifier_deadline.run(
+            "classification", classify_strat, question, formatted_chat_history, classifier_deadline
+        )
+    except DeadlineExceeded:
+        ## Out of time: skip the rewrite and route on keywords
+        classification_response = fallback_classification(question)
+        print("[Classifier] Timed out, falling back to keyword routing \n")
+
     if "classification" in classification_response:
         classification = classification_response["classification"]
         rewritten = classification_response["rewritten_question"]
+        manuals = parse_manuals(classification_response.get("manuals", "all"))
     ## ERROR RESPONSE FROM CLASSIFICATION
     else:
         return ChatResponse(
@@ -33,7 +83,7 @@ async def handle_user_input(question: str, chat_history: str):
             meta= MetaData(
                 raw_error=classification_response['error']
             )
-        ).model_dump()
+        )
     
     ## Log the output from classification layer
     print(f"[Classifier Output] Classification: {classification} \n")
@@ -49,14 +99,19 @@ async def handle_user_input(question: str, chat_history: str):
     if classification == "rag":
         print(f"🔍 Initializing RAG pipeline for: {question}")
         # call_rag_pipeline(rewritten) — your logic
-        return process_rag(question)
+        return await process_rag(question, manuals, deadline)
 
 
     ## If SQL then initiatlize sql generator
     elif classification == "sql":
         print(f"\n\n🧮 Initializing SQL generator for: {question}")
+
+        try:
+            response = await deadline.run("sql", generate_sql_response, question, deadline)
+        except DeadlineExceeded:
+            return timeout_response("SQL", question)
         
-        return process_sql_generator(question)
+        return process_sql_generator(question, response_format, response=response)
     
 
     ## If the question is invalid and out of context then return response appropriately
@@ -69,7 +124,7 @@ async def handle_user_input(question: str, chat_history: str):
         meta=MetaData(
             rewritten_query=question
         )
-    ).model_dump()
+    )
 
 
 """
@@ -77,14 +132,37 @@ Process the RAG response
 
 Args: 
     question (str): User's question, raw or rewritten
+    manuals (list): shard names of the manuals to search, None for all
+    deadline (Deadline): request budget, when generation runs out of it the
+        retrieved pages are returned without an answer
 
 Returns:
     Chat model response 
     ChatModel()
 
 """
-def process_rag(question:str):
-    rag_response = get_rag_response(question)
+async def process_rag(question:str, manuals=None, deadline:Deadline=None):
+    deadline = deadline or Deadline()
+
+    try:
+        retrieved = await deadline.run("retrieval", retrieve_context, question, manuals, deadline)
+    except DeadlineExceeded:
+        return timeout_response("RAG", question)
+
+    try:
+        rag_response = await deadline.run("generation", answer_with_context, question, retrieved, deadline)
+    except DeadlineExceeded:
+        ## No time left for an answer, the pages found still point the user to it
+        return ChatResponse(
+            status="success",
+            source="RAG",
+            message="Answer generation timed out, returning the retrieved pages only",
+            bot_response="Sorry, I couldn't finish an answer in time. These manual pages cover your question.",
+            meta=MetaData(
+                context_pages=[ctx.metadata for ctx in retrieved['context']],
+                rewritten_query=question
+            )
+        )
 
     ## Return error response
     if rag_response["status"]  == "error":
@@ -97,7 +175,7 @@ def process_rag(question:str):
                 raw_error=rag_response["error"],
                 rewritten_query=question
             )
-        ).model_dump()
+        )
 
     ## Return a successful response from LLM
     return ChatResponse(
@@ -109,7 +187,7 @@ def process_rag(question:str):
             context_pages=[ctx.metadata for ctx in rag_response['context']],
             rewritten_query=question
         )
-    ).model_dump()
+    )
 
 
 """
@@ -117,12 +195,17 @@ Processing SQL GENERATOR RESPONSE
 
 ARGS:
     question: str
+    response_format: "rows" for a list of row objects with formatted prices,
+        "columnar" for {columns, rows} arrays with column type hints
+    response: result already computed for the question (e.g. by a SQL template),
+        generated from the question when None
 Response: 
-    JSON object which changeing structures
+    ChatResponse with the SQL result as bot_response
 """
-def process_sql_generator(question:str):
+def process_sql_generator(question:str, response_format:str = "rows", response=None):
     ## Calls sql result generator
-    response = generate_sql_response(question)
+    if response is None:
+        response = generate_sql_response(question)
 
     # Return error response
     if response['status'] == "error":
@@ -136,11 +219,13 @@ def process_sql_generator(question:str):
                 rewritten_query=question,
                 raw_error=response.get('error', "")
             )
-        ).model_dump()
+        )
     
-    sql_data = response.get('results')
-
-    sql_data = add_dollar_sign(sql_data)
+    if response_format == "columnar":
+        sql_data = {"columns": response['columns'], "rows": response['rows']}
+    else:
+        names = [column["name"] for column in response['columns']]
+        sql_data = add_dollar_sign([dict(zip(names, row)) for row in response['rows']])
     
     ## Return valid SQL table response
     return ChatResponse(
@@ -152,7 +237,7 @@ def process_sql_generator(question:str):
             sql_query=response.get('sql_query'),
             rewritten_query=question
         )
-    ).model_dump()
+    )
 
 
 def add_dollar_sign(sql_data):
@@ -168,6 +253,43 @@ def add_dollar_sign(sql_data):
 
 
 
+"""
+Loads everything the first question would otherwise pay for: LLM clients and prompts,
+the MySQL connection pool and the vector index (read into the page cache).
+
+Args:
+    only (list): stage names to (re)try, all when None
+
+Returns:
+    {stage: "ok" or the error message}
+"""
+def warm_up(only=None):
+    def load_index():
+        vectorstore = load_FAISS_retriever()
+        if hasattr(vectorstore, "warm"):
+            vectorstore.warm()
+
+    stages = {
+        "classifier": get_classifier_chain,
+        "sql_client": get_openai_client,
+        "db_pool": get_connection_pool,
+        "index": load_index,
+        "rag_chain": get_stuff_chain,
+    }
+
+    status = {}
+    for name, load in stages.items():
+        if only is not None and name not in only:
+            continue
+        try:
+            load()
+            status[name] = "ok"
+        except Exception as e:
+            print(f"Warm-up of {name} failed: {str(e)}")
+            status[name] = str(e)
+    return status
+
+
 ## Test the working of initiator
 if __name__ == "__main__":
 
@@ -0,0 +1,35 @@
+import datetime
+from decimal import Decimal
+
+import orjson
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+
+## Types orjson doesn't encode natively
+def _default(obj):
+    # Models are encoded field by field, without the copy model_dump() would make
+    if isinstance(obj, BaseModel):
+        return dict(obj)
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, datetime.timedelta):
+        return obj.total_seconds()
+    if isinstance(obj, (bytes, bytearray)):
+        return obj.decode("utf-8", errors="replace")
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError
+
+
+"""
+JSON response encoded with orjson
+
+Dates, datetimes, tuples and pydantic models (like ChatResponse) are encoded directly,
+so SQL rows can be returned as fetched from the cursor.
+"""
+class FastJSONResponse(JSONResponse):
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
@@ -1,25 +1,138 @@
 import sys
 import os
-from langchain.schema import Document
+from langchain_core.documents import Document
+from config import ANSWER_CACHE_ENABLED, ANSWER_CACHE_PATH, ANSWER_CACHE_SIZE, ANSWER_CACHE_THRESHOLD
+from services.answer_cache import SemanticAnswerCache
+from services.deadline import Deadline
 
 # ✅ This line adds the project root (1 level up from this file) to sys.path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..','retrieving')))
-from generation import generate # type: ignore
+from generation import generate_with_context, get_stuff_chain # type: ignore
 from retrieval import load_FAISS_retriever # type: ignore
 
-def get_rag_response(question):
+## Final answers keyed by question embedding, invalidated when the index is rebuilt
+answer_cache = SemanticAnswerCache(
+    path=ANSWER_CACHE_PATH,
+    max_entries=ANSWER_CACHE_SIZE,
+    threshold=ANSWER_CACHE_THRESHOLD
+) if ANSWER_CACHE_ENABLED else None
 
-    ## Loading Faiss retriever 
-    retriever = load_FAISS_retriever().as_retriever()
+## Per-request timeout on the OpenAI call, the client's own default is 600s
+def embed_question(vectorstore, question, timeout=None):
+    if timeout is None:
+        return vectorstore.embeddings.embed_query(question)
+    return vectorstore.embeddings.embed_query(question, timeout=timeout)
 
-    response = generate(question, retriever)
+
+"""
+Retrieval half of the RAG pipeline: embeds the question once, then serves a cached answer
+or searches the index shards of `manuals`
+
+Args:
+    deadline (Deadline): request budget, the embedding call gets what is left of it
+
+Raises:
+    DeadlineExceeded: the question couldn't be embedded in time
+
+Returns:
+    {status, answer (only when cached, else None), context, error,
+     cache_key (embedding, build id, scope) to store the generated answer under, or None}
+"""
+def retrieve_context(question, manuals=None, deadline=None):
+    deadline = deadline or Deadline()
+
+    ## Loading Faiss retriever
+    vectorstore = load_FAISS_retriever()
+
+    ## The question is embedded once, for the cache lookup and for the search
+    try:
+        embedding = deadline.call(lambda timeout: embed_question(vectorstore, question, timeout))
+    except Exception as e:
+        if deadline.expired():
+            raise deadline.timed_out("retrieval")
+        print(f"❌ RAG embedding error: {str(e)}")
+        return {"status": "error", "answer": None, "context": [], "error": str(e), "cache_key": None}
+
+    ## Only the mmap index shards carry a build id to version cache entries with
+    use_cache = answer_cache is not None and hasattr(vectorstore, "build_id_of")
+
+    ## Cached answers are only reused for questions routed to the same manuals, and only
+    ## until one of those manuals' shards is rebuilt
+    build_id, scope = None, None
+    if use_cache:
+        names = vectorstore.select_shards(manuals)
+        build_id = vectorstore.build_id_of(names)
+        scope = ",".join(names)
+
+    if use_cache:
+        cached = answer_cache.lookup(embedding, build_id, scope)
+        if cached:
+            print(f"\n\n ## RAG answer served from cache (cached question: {cached['question']})\n")
+            return {
+                "status": "success",
+                "answer": cached["answer"],
+                "context": [Document(**ctx) for ctx in cached["context"]],
+                "error": None,
+                "cache_key": None
+            }
+
+    try:
+        docs = vectorstore.similarity_search_by_vector(embedding, k=4, manuals=manuals)
+    except Exception as e:
+        print(f"❌ RAG retrieval error: {str(e)}")
+        return {"status": "error", "answer": None, "context": [], "error": str(e), "cache_key": None}
+
+    return {
+        "status": "success",
+        "answer": None,
+        "context": docs,
+        "error": None,
+        "cache_key": (embedding, build_id, scope) if use_cache else None
+    }
+
+
+"""
+Generation half of the RAG pipeline: answers from the context found by retrieve_context
+
+Args:
+    deadline (Deadline): request budget, the LLM call gets what is left of it
+
+Raises:
+    DeadlineExceeded: the answer couldn't be generated in time
+"""
+def answer_with_context(question, retrieved, deadline=None):
+    if retrieved["status"] == "error" or retrieved["answer"] is not None:
+        return retrieved
+
+    deadline = deadline or Deadline()
+    docs = retrieved["context"]
+    response = generate_with_context(question, docs, deadline)
+
+    if response["status"] == "error" and deadline.expired():
+        raise deadline.timed_out("generation")
+
+    if retrieved["cache_key"] and response["status"] == "success":
+        embedding, build_id, scope = retrieved["cache_key"]
+        answer_cache.put(
+            embedding,
+            build_id,
+            question,
+            response["answer"],
+            [{"page_content": doc.page_content, "metadata": doc.metadata} for doc in docs],
+            scope
+        )
 
     return response
 
 
-#testing 
+def get_rag_response(question, manuals=None):
+    deadline = Deadline()
+    return answer_with_context(question, retrieve_context(question, manuals, deadline), deadline)
+
+
+#testing
 if __name__ == "__main__":
     response = get_rag_response("difference between an invoice and a purchase order")
-    
+
     pages = [ctx.metadata for ctx in response["context"]]
-    print(pages)
\ No newline at end of file
+    print(pages)
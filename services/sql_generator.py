@@ -1,30 +1,83 @@
 import os
 import json
+import threading
+import time
 from dotenv import load_dotenv
 import mysql.connector
-from fastapi.responses import JSONResponse
-from fastapi.encoders import jsonable_encoder
+from mysql.connector import FieldType, pooling
 from openai import OpenAI
-import datetime
+from config import AGGREGATE_ROUTING, SUMMARY_STATUS_MAX_AGE, DB_POOL_SIZE, SQL_MODEL_TIERS, SQL_MODEL_BASE_URL, SQL_EXPLAIN_CHECK
+from services.aggregates import route_to_summary, summary_is_built
+from services.sql_validator import schema_from_prompt, validate_sql
+from services.deadline import Deadline, DeadlineExceeded
 
 load_dotenv()
 
-def create_connection():
+## Created once per worker by the startup warm-up (or the first query), see get_connection_pool
+_connection_pool = None
+_openai_client = None
+
+def get_db_config():
     # MySQL connection
-    db_config = {
+    return {
         'host': os.getenv("db_host"),
         'user': os.getenv("db_user"),
         'password': os.getenv("db_password"),  # Updated with your MySQL password
         'database': os.getenv("db_database")
     }
+
+def get_connection_pool():
+    global _connection_pool
+    if _connection_pool is None:
+        _connection_pool = pooling.MySQLConnectionPool(
+            pool_name="finance_chat",
+            pool_size=DB_POOL_SIZE,
+            **get_db_config()
+        )
+    return _connection_pool
+
+def get_openai_client():
+    global _openai_client
+    if _openai_client is None:
+        ## base_url can point the SQL models at a local fake server (benchmarks/fake_openai_server.py)
+        _openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), base_url=SQL_MODEL_BASE_URL)
+    return _openai_client
+
+def create_connection():
+    ## Pooled connections go back to the pool on close()
     try:
-        conn = mysql.connector.connect(**db_config)
+        return get_connection_pool().get_connection()
+    except pooling.PoolError as err:
+        print(f"MySQL pool unavailable, opening a direct connection: {err}")
+    except mysql.connector.Error as err:
+        print(f"Error connecting to MySQL: {err}")
+        return None
+
+    try:
+        conn = mysql.connector.connect(**get_db_config())
         return conn
     except mysql.connector.Error as err:
         print(f"Error connecting to MySQL: {err}")
         return None
     
     
+## Column type hints sent with columnar SQL results, formatting is left to the client
+PRICE_COLUMNS = ("Total_Price", "Unit_Price")
+TYPE_HINTS = {
+    "TINY": "integer", "SHORT": "integer", "INT24": "integer", "LONG": "integer", "LONGLONG": "integer",
+    "DECIMAL": "number", "NEWDECIMAL": "number", "FLOAT": "number", "DOUBLE": "number",
+    "DATE": "date", "DATETIME": "datetime", "TIMESTAMP": "datetime",
+}
+
+def describe_columns(description):
+    columns = []
+    for column in description:
+        name, type_code = column[0], column[1]
+        hint = "currency" if name in PRICE_COLUMNS else TYPE_HINTS.get(FieldType.get_info(type_code), "string")
+        columns.append({"name": name, "type": hint})
+    return columns
+
+
 def generate_prompt(question):
     return f"""
 You are a financial database query assistant. Convert ONLY finance-related questions into MySQL queries.
@@ -95,7 +148,184 @@ INVALID PATTERNS (return INVALID_QUERY):
     """
 
 
-def generate_sql_response(question: str):
+## Tables and columns the generated SQL may reference, read from the prompt itself
+SQL_SCHEMA = schema_from_prompt(generate_prompt(""))
+
+## Per-tier counters of the SQL model cascade, see get_cascade_stats
+_cascade_stats = {}
+_cascade_lock = threading.Lock()
+
+def record_tier(model, started, accepted, reason=None):
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    with _cascade_lock:
+        stats = _cascade_stats.setdefault(model, {
+            "attempts": 0, "accepted": 0, "escalated": 0,
+            "latency_ms_total": 0.0, "latency_ms_max": 0.0, "rejections": {}
+        })
+        stats["attempts"] += 1
+        stats["accepted" if accepted else "escalated"] += 1
+        stats["latency_ms_total"] += elapsed_ms
+        stats["latency_ms_max"] = max(stats["latency_ms_max"], elapsed_ms)
+        if reason:
+            kind = reason.split(":")[0]
+            stats["rejections"][kind] = stats["rejections"].get(kind, 0) + 1
+
+## SQL a tier got accepted with that MySQL then rejected (unknown column/table) counts as an escalation
+def record_db_rejection(model, reason):
+    with _cascade_lock:
+        stats = _cascade_stats.get(model)
+        if stats:
+            stats["accepted"] -= 1
+            stats["escalated"] += 1
+            stats["rejections"][reason] = stats["rejections"].get(reason, 0) + 1
+
+def get_cascade_stats():
+    with _cascade_lock:
+        return {
+            model: {
+                "attempts": stats["attempts"],
+                "accepted": stats["accepted"],
+                "escalated": stats["escalated"],
+                "hit_rate": round(stats["accepted"] / stats["attempts"], 3),
+                "avg_latency_ms": round(stats["latency_ms_total"] / stats["attempts"], 1),
+                "max_latency_ms": round(stats["latency_ms_max"], 1),
+                "rejections": dict(stats["rejections"]),
+            }
+            for model, stats in _cascade_stats.items()
+        }
+
+
+def request_sql(model, question, timeout=None):
+    ## Retries are left to Deadline.call, which only retries while the request has time for it
+    client = get_openai_client().with_options(max_retries=0)
+    if timeout is not None:
+        client = client.with_options(timeout=timeout)
+
+    response = client.chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": "You are a helpful assistant that converts natural language to MySQL queries."},
+            {"role": "user", "content": generate_prompt(question)}
+        ],
+        temperature=0.2
+    )
+    print(f"OpenAI raw response ({model}):\n{response}")  #print openai response
+  
+    sql_query = response.choices[0].message.content.strip()
+    
+    # Remove any markdown formatting
+    if sql_query.startswith("```sql"):
+        sql_query = sql_query[7:]
+    if sql_query.startswith("```"):
+        sql_query = sql_query[3:]
+    if sql_query.endswith("```"):
+        sql_query = sql_query[:-3]
+    
+    return sql_query.strip()
+
+
+## Optional dry run: lets MySQL resolve tables, columns and functions without executing the query
+def explain_sql(sql_query):
+    conn = create_connection()
+    if not conn:
+        return {"valid": True, "safe": True, "reason": ""}
+    try:
+        cursor = conn.cursor()
+        cursor.execute("EXPLAIN " + sql_query)
+        cursor.fetchall()
+        cursor.close()
+        return {"valid": True, "safe": True, "reason": ""}
+    except mysql.connector.Error as err:
+        return {"valid": False, "safe": True, "reason": f"EXPLAIN failed: {err}"}
+    finally:
+        conn.close()
+
+
+## Error MySQL raises when MAX_EXECUTION_TIME interrupts a query
+ER_QUERY_TIMEOUT = 3024
+
+## Errors for SQL that references a column or table the database doesn't have, a stronger tier may get it right
+ER_BAD_FIELD_ERROR = 1054
+ER_NO_SUCH_TABLE = 1146
+SCHEMA_ERRORS = {ER_BAD_FIELD_ERROR, ER_NO_SUCH_TABLE}
+
+## Caps the SELECTs of this connection's session at the request's remaining budget
+def set_execution_time_limit(cursor, deadline):
+    remaining = deadline.remaining()
+    if remaining is not None:
+        cursor.execute("SET SESSION MAX_EXECUTION_TIME = %s", (max(1, int(remaining * 1000)),))
+
+
+"""
+Generates SQL with a cascade of models, cheapest first (SQL_MODEL_TIERS)
+
+Each tier's SQL is validated locally (single read-only SELECT over the prompt's schema,
+plus EXPLAIN when SQL_EXPLAIN_CHECK is on) and the question only escalates to the next
+tier when validation fails or the model answers INVALID_QUERY. The last tier's answer is
+used unless it isn't a safe read-only query. Each tier only gets what is left of the
+deadline, and no tier starts once it has run out. `first_tier` skips the cheaper tiers,
+e.g. after the database rejected their SQL.
+
+Raises:
+    DeadlineExceeded: out of time before an answer was accepted
+Returns:
+    {"sql_query": str, "model": str, "tier": int, "error": None or the reason the SQL was rejected}
+"""
+def generate_sql(question: str, deadline=None, first_tier=0):
+    deadline = deadline or Deadline()
+
+    for tier, model in enumerate(SQL_MODEL_TIERS):
+        if tier < first_tier:
+            continue
+        last = tier == len(SQL_MODEL_TIERS) - 1
+        started = time.perf_counter()
+
+        if deadline.expired():
+            raise deadline.timed_out("sql_generation")
+
+        try:
+            sql_query = deadline.call(lambda timeout: request_sql(model, question, timeout))
+        except Exception as e:
+            if deadline.expired():
+                record_tier(model, started, accepted=False, reason="timeout")
+                raise deadline.timed_out("sql_generation")
+            if last:
+                raise
+            record_tier(model, started, accepted=False, reason="request error")
+            print(f"\n\nEscalating from {model}, request failed: {str(e)}")
+            continue
+
+        if sql_query == "INVALID_QUERY":
+            ## Only the last tier gets to turn a question down
+            check = {"valid": last, "safe": True, "reason": "INVALID_QUERY"}
+        else:
+            check = validate_sql(sql_query, SQL_SCHEMA)
+            if check["valid"] and SQL_EXPLAIN_CHECK:
+                check = explain_sql(sql_query)
+
+        accepted = check["valid"] or (last and check["safe"])
+        record_tier(model, started, accepted, None if check["valid"] else check["reason"])
+
+        if accepted:
+            return {"sql_query": sql_query, "model": model, "tier": tier, "error": None}
+        if last:
+            return {"sql_query": sql_query, "model": model, "tier": tier, "error": f"Generated SQL rejected: {check['reason']}"}
+
+        print(f"\n\nEscalating from {model}: {check['reason']}")
+
+
+"""
+Generates the SQL for a question, runs it and returns the rows
+
+Args:
+    question (str): user's question, raw or rewritten
+    deadline (Deadline): request budget shared by generation and execution, none when None
+
+Raises:
+    DeadlineExceeded: generation or execution ran out of time
+"""
+def generate_sql_response(question: str, deadline=None):
+    deadline = deadline or Deadline()
     # data = request.json
     # question = data.get('question', '')
     
@@ -111,73 +341,84 @@ def generate_sql_response(question: str):
         # Get SQL query from OpenAI using the new client
         print("Generating response for ", question, "......\n\n")
 
-        client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant that converts natural language to MySQL queries."},
-                {"role": "user", "content": generate_prompt(question)}
-            ],
-            temperature=0.2
-        )
-        print(f"OpenAI raw response:\n{response}")  #print openai response
-      
-        sql_query = response.choices[0].message.content.strip()
-        
-        # Remove any markdown formatting
-        if sql_query.startswith("```sql"):
-            sql_query = sql_query[7:]
-        if sql_query.startswith("```"):
-            sql_query = sql_query[3:]
-        if sql_query.endswith("```"):
-            sql_query = sql_query[:-3]
-        
-        sql_query = sql_query.strip()
-        
-        print(f"\n\nGenerated SQL query: {sql_query}") #print sql queries
-        
-        # Check if the query is invalid
-        if sql_query == "INVALID_QUERY":
-            return {
-                'status': 'error',
-                'sql_query': sql_query,
-                'message': "LLM responded with INVALID_QUERY for user's question",
-                'error': "Stopped before execution: input not recognized as a question.",
-            }
+        ## Generate and run, escalating to the next tier when the database rejects the SQL
+        first_tier = 0
+        while True:
+            generated = generate_sql(question, deadline, first_tier)
+            sql_query = generated['sql_query']
+
+            print(f"\n\nGenerated SQL query ({generated['model']}): {sql_query}") #print sql queries
+
+            if generated['error']:
+                return {
+                    'status': 'error',
+                    'sql_query': sql_query,
+                    'message': "Generated SQL query failed validation",
+                    'error': generated['error'],
+                }
         
-        results = None
-        # Execute the query against the database
-        conn = create_connection()
-        if conn:
-            try:
-                cursor = conn.cursor(dictionary=True)
-                cursor.execute(sql_query)
-                results = cursor.fetchall()
-
-                ## Date JSON error fix
-                for row in results:
-                    for key, value in row.items():
-                        if isinstance(value, (datetime.date, datetime.datetime)):
-                            row[key] = value.isoformat()
-
-                cursor.close()
-                conn.close()
-            except Exception as db_err:
-                print(f"Database query error: {str(db_err)}")
+            # Check if the query is invalid
+            if sql_query == "INVALID_QUERY":
                 return {
                     'status': 'error',
-                    'error': f'Database query error: {str(db_err)}',
                     'sql_query': sql_query,
-                    'message': "Error while executing the SQL query in the database"
+                    'message': "LLM responded with INVALID_QUERY for user's question",
+                    'error': "Stopped before execution: input not recognized as a question.",
                 }
-        else:
-            return {
-                'status': 'error',
-                'error': 'Database connection failed',
-                'sql_query': sql_query,
-                'message': "Database connection error"
-            }
         
+            results = None
+            # Execute the query against the database
+            conn = create_connection()
+            if conn:
+                try:
+                    cursor = conn.cursor()
+                    set_execution_time_limit(cursor, deadline)
+
+                    ## Answer common aggregates from the precomputed summary tables when possible
+                    routed = route_to_summary(sql_query) if AGGREGATE_ROUTING else None
+                    if routed and summary_is_built(cursor, routed[0], mutable=routed[2], max_age=SUMMARY_STATUS_MAX_AGE):
+                        try:
+                            cursor.execute(routed[1])
+                            results = cursor.fetchall()
+                            print(f"\n\nAnswered from summary table {routed[0]}: {routed[1]}")
+                        except Exception as summary_err:
+                            print(f"Summary table query error, falling back to base tables: {str(summary_err)}")
+                            results = None
+
+                    if results is None:
+                        cursor.execute(sql_query)
+                        results = cursor.fetchall()
+
+                    ## Rows are kept as tuples, dates and decimals are encoded by the JSON response class
+                    columns = describe_columns(cursor.description)
+
+                    cursor.close()
+                    conn.close()
+                except Exception as db_err:
+                    conn.close()
+                    if getattr(db_err, "errno", None) == ER_QUERY_TIMEOUT or deadline.expired():
+                        raise deadline.timed_out("sql_execution")
+                    if getattr(db_err, "errno", None) in SCHEMA_ERRORS and generated['tier'] < len(SQL_MODEL_TIERS) - 1:
+                        print(f"\n\nEscalating from {generated['model']}, the database rejected its SQL: {str(db_err)}")
+                        record_db_rejection(generated['model'], "database schema error")
+                        first_tier = generated['tier'] + 1
+                        continue
+                    print(f"Database query error: {str(db_err)}")
+                    return {
+                        'status': 'error',
+                        'error': f'Database query error: {str(db_err)}',
+                        'sql_query': sql_query,
+                        'message': "Error while executing the SQL query in the database"
+                    }
+            else:
+                return {
+                    'status': 'error',
+                    'error': 'Database connection failed',
+                    'sql_query': sql_query,
+                    'message': "Database connection error"
+                }
+            break
+
         if not results:
             message = "I couldn't find any data matching your query. Please try asking a different question.",
             message1 = "there is no such data in the db"
@@ -192,11 +433,14 @@ def generate_sql_response(question: str):
         ## Return valid SQL table response
         return {
             'status': 'success',
-            'results': results,
+            'columns': columns,
+            'rows': results,
             'sql_query': sql_query,
             'message': 'Successfully returned a valid SQL result'
         }
         
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         print(f"Error: {str(e)}")
         return {
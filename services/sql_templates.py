@@ -0,0 +1,339 @@
+"""
+Deterministic templates for the most common SQL questions
+
+Questions shaped like the patterns in sql_generator.generate_prompt ("pending invoices",
+"total spent on vendor ABC", "orders placed last week", "top 5 vendors by total", ...)
+are matched locally, their slots (status, vendor, date range, N) are extracted and the
+matching parameterized query runs as a server-side prepared statement. They skip both
+the classifier and the SQL generator. Anything that doesn't match a template exactly
+returns None and goes through the LLM path as before.
+"""
+
+import datetime
+import queue
+import re
+import time
+
+import mysql.connector
+
+from config import DB_POOL_SIZE
+from services.deadline import Deadline
+from services.sql_generator import ER_QUERY_TIMEOUT, describe_columns, get_db_config
+
+
+######################################## SLOTS ########################################
+
+## Status words users type -> Status values in the tables
+STATUSES = {
+    "pending": ["Pending"],
+    "overdue": ["Overdue"],
+    "approved": ["Approved"],
+    "paid": ["Paid"],
+    "completed": ["Approved", "Paid"],
+    "complete": ["Approved", "Paid"],
+    "cancelled": ["Cancelled"],
+    "canceled": ["Cancelled"],
+}
+
+## Words that mean the vendor slot holds more than one name or a condition, e.g. "Dell and HP", "ABC in 2024"
+_NOT_A_VENDOR = re.compile(r"\b(and|or|vs|versus|in|during|since|before|after|between|compared|each|every|per|all|vendors|suppliers)\b|\b\d{4}\b", re.IGNORECASE)
+
+## Templates whose slots are free text: when they find nothing, the question may just not be what the
+## template assumed, so the SQL generator gets a try instead of answering "no data"
+FREE_TEXT_TEMPLATES = {"vendor_total"}
+
+## Document words -> (table, date column used for date ranges)
+DOCUMENTS = {
+    "invoice": ("invoices", "Invoice_Date"),
+    "order": ("purchase_order", "Date"),
+    "purchase order": ("purchase_order", "Date"),
+    "po": ("purchase_order", "Date"),
+}
+
+NUMBERS = {"one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10}
+
+## "what are overdue invoices" reads as a definition question, so list templates don't take "what are/is"
+_PREFIX = r"(?:(?:please|can you|could you|show(?: me)?|list|give me|get|display|find)\s+)*"
+_ASK = r"(?:(?:what is|what was|what's)(?:\s+the)?\s+)?"
+_ALL = r"(?:all\s+)?(?:the\s+)?(?:of\s+the\s+)?"
+_STATUS = r"(?P<status>" + "|".join(STATUSES) + r")"
+_DOC = r"(?P<doc>invoices?|purchase orders?|orders?|pos)"
+_VERB = r"(?:\s+(?:placed|created|issued|raised|received|made))?"
+_RANGE_WORDS = (
+    r"today|yesterday|this week|last week|past week|this month|last month|past month|this year|last year"
+    r"|(?:in\s+)?(?:the\s+)?(?:last|past)\s+\d+\s+days"
+)
+_RANGE = r"(?:\s+(?:in\s+|from\s+|during\s+|for\s+)?(?P<range>" + _RANGE_WORDS + r"))"
+_SO_FAR = r"(?:\s+(?:are there|do we have|so far|in total))*"
+
+
+def _document(word):
+    word = word.lower().rstrip("s") if word.lower() != "pos" else "po"
+    return DOCUMENTS[word]
+
+
+def date_range(text, today=None):
+    """
+    Returns [start, end) dates for a relative range like "last week" or "past 30 days".
+    "last week" / "past month" are the trailing 7 / 30 days, "last month" the previous calendar month.
+    """
+    today = today or datetime.date.today()
+    tomorrow = today + datetime.timedelta(days=1)
+    text = " ".join(text.lower().split())
+
+    days = re.search(r"(\d+)\s+days", text)
+    if days:
+        return today - datetime.timedelta(days=int(days.group(1))), tomorrow
+    if text == "today":
+        return today, tomorrow
+    if text == "yesterday":
+        return today - datetime.timedelta(days=1), today
+    if text == "this week":
+        return today - datetime.timedelta(days=today.weekday()), tomorrow
+    if text in ("last week", "past week"):
+        return today - datetime.timedelta(days=7), tomorrow
+    if text == "this month":
+        return today.replace(day=1), tomorrow
+    if text == "past month":
+        return today - datetime.timedelta(days=30), tomorrow
+    if text == "last month":
+        first = today.replace(day=1)
+        return (first - datetime.timedelta(days=1)).replace(day=1), first
+    if text == "this year":
+        return today.replace(month=1, day=1), tomorrow
+    if text == "last year":
+        return today.replace(year=today.year - 1, month=1, day=1), today.replace(month=1, day=1)
+    raise ValueError(f"Unknown date range: {text}")
+
+
+######################################## TEMPLATES ########################################
+
+def _filters(slots, date_column):
+    clauses, params = [], []
+    if slots.get("status"):
+        values = STATUSES[slots["status"].lower()]
+        clauses.append(f"Status IN ({', '.join(['%s'] * len(values))})")
+        params.extend(values)
+    if slots.get("range"):
+        start, end = date_range(slots["range"])
+        clauses.append(f"{date_column} >= %s AND {date_column} < %s")
+        params.extend([start, end])
+    return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+
+def _status_list(slots):
+    table, date_column = _document(slots["doc"])
+    where, params = _filters(slots, date_column)
+    return f"SELECT * FROM {table}{where} ORDER BY {date_column} DESC", params
+
+
+def _count(slots):
+    table, date_column = _document(slots["doc"])
+    where, params = _filters(slots, date_column)
+    return f"SELECT COUNT(*) AS count FROM {table}{where}", params
+
+
+def _vendor_total(slots):
+    vendor = slots["vendor"].strip(" '\"")
+    if not vendor or _NOT_A_VENDOR.search(vendor):
+        return None
+    where, params = _filters(slots, "Date")
+    ## Exact name (case-insensitive collation), "ABC" doesn't also sum "ABC Holdings"
+    where = (where + " AND" if where else " WHERE") + " Vendor_Name = %s"
+    return f"SELECT SUM(Total_Price) AS total_spent FROM purchase_order{where}", params + [vendor]
+
+
+def _top_vendors(slots):
+    n = slots.get("n") or "5"
+    n = int(NUMBERS.get(n.lower(), n))
+    where, params = _filters(slots, "Date")
+    return (
+        f"SELECT Vendor_Name, SUM(Total_Price) AS total FROM purchase_order{where} "
+        f"GROUP BY Vendor_Name ORDER BY total DESC LIMIT %s",
+        params + [n],
+    )
+
+
+def _average(slots):
+    table, date_column = _document(slots["doc"])
+    where, params = _filters(slots, date_column)
+    return f"SELECT AVG(Total_Price) AS average_amount FROM {table}{where}", params
+
+
+## (name, pattern over the whole normalized question, builder returning (sql, params) or None)
+TEMPLATES = [
+    ("status_list", _PREFIX + _ALL + _STATUS + r"\s+" + _DOC + _VERB + _RANGE + "?", _status_list),
+    ("count", _ASK + r"(?:count of|number of|total number of|how many)\s+(?:the\s+)?"
+        r"(?:" + _STATUS + r"\s+)?" + _DOC + _VERB + _RANGE + "?" + _SO_FAR, _count),
+    ("documents_in_range", _PREFIX + _ALL + _DOC + _VERB + _RANGE, _status_list),
+    ## The "vendor"/"supplier" keyword is required, "how much did we spend on laptops" is not a vendor total
+    ("vendor_total", _ASK + r"(?:total|total amount|how much)(?:\s+(?:did|have)?\s*we)?"
+        r"\s+(?:spent|spend|paid|pay)\s+(?:on|to|with|for)\s+(?:the\s+)?(?:vendor|supplier)\s+"
+        r"(?P<vendor>[\"']?[\w&.'-]+(?:\s+[\w&.'-]+){0,5}?[\"']?)" + _RANGE + "?", _vendor_total),
+    ("top_vendors", _PREFIX + r"(?:the\s+)?top\s+(?:(?P<n>\d+|" + "|".join(NUMBERS) + r")\s+)?(?:vendors?|suppliers?)"
+        r"(?:\s+by\s+(?:total\s+)?(?:spend|spending|spent|amount|value|order value|purchase value|total))?" + _RANGE + "?", _top_vendors),
+    ("average", _PREFIX + _ASK + r"(?:the\s+)?(?:average|avg|mean)\s+(?P<doc>invoice|order|purchase order|po)"
+        r"\s+(?:amount|value|total|price)" + _RANGE + "?", _average),
+]
+_COMPILED = [(name, re.compile(pattern, re.IGNORECASE), build) for name, pattern, build in TEMPLATES]
+
+
+def match_template(question):
+    """
+    Returns (template name, sql, params) for a question that matches a template, else None.
+    """
+    text = " ".join(re.sub(r"[?!.]+$", "", question.strip()).split())
+    for name, pattern, build in _COMPILED:
+        match = pattern.fullmatch(text)
+        if not match:
+            continue
+        built = build({key: value for key, value in match.groupdict().items() if value})
+        if built:
+            return name, built[0], built[1]
+    return None
+
+
+######################################## EXECUTION ########################################
+
+## Seconds a template connection may take to connect (and, with the pure-Python connector, to answer a read)
+CONNECT_TIMEOUT = 10
+
+
+class _PreparedConnection:
+    """
+    One dedicated connection and the statements prepared on it, used by one request at a time.
+    """
+
+    def __init__(self):
+        self.conn = None
+        self.cursors = {}
+        self.time_limit_ms = 0
+
+    def connect(self, timeout):
+        connect_timeout = CONNECT_TIMEOUT if timeout is None else min(CONNECT_TIMEOUT, timeout)
+        self.conn = mysql.connector.connect(**get_db_config(), connection_timeout=max(1, int(connect_timeout)))
+        ## Autocommit so this long-lived connection never reads from a stale snapshot
+        self.conn.autocommit = True
+        self.cursors = {}
+        self.time_limit_ms = 0
+
+    def set_time_limit(self, timeout):
+        ## Session setting, only sent when it changes
+        limit_ms = 0 if timeout is None else max(1, int(timeout * 1000))
+        if limit_ms != self.time_limit_ms:
+            cursor = self.conn.cursor()
+            cursor.execute("SET SESSION MAX_EXECUTION_TIME = %s", (limit_ms,))
+            cursor.close()
+            self.time_limit_ms = limit_ms
+
+    def execute(self, sql, params, timeout):
+        for attempt in range(2):
+            try:
+                if self.conn is None or not self.conn.is_connected():
+                    self.connect(timeout)
+                self.set_time_limit(timeout)
+                cursor = self.cursors.get(sql)
+                if cursor is None:
+                    cursor = self.conn.cursor(prepared=True)
+                    self.cursors[sql] = cursor
+                cursor.execute(sql, params)
+                return cursor.description, cursor.fetchall()
+            except (mysql.connector.OperationalError, mysql.connector.InterfaceError):
+                ## Lost connection: reconnect and prepare again once
+                self.conn = None
+                if attempt:
+                    raise
+
+
+class PreparedStatementCache:
+    """
+    Runs template queries as server-side prepared statements, prepared once per distinct
+    SQL text and connection and reused. Uses `size` dedicated connections (DB_POOL_SIZE by
+    default): pooled connections are reset when they go back to the pool, which drops their
+    prepared statements. Each request takes a connection of its own, so concurrent template
+    queries run side by side and a stalled one only holds up its own connection.
+    """
+
+    def __init__(self, size=DB_POOL_SIZE):
+        ## Connected lazily, the first request on each slot pays for the connect
+        self._idle = queue.LifoQueue()
+        for _ in range(size):
+            self._idle.put(_PreparedConnection())
+
+    def execute(self, sql, params, timeout=None):
+        """
+        Args:
+            timeout (float): seconds the query may run (MySQL MAX_EXECUTION_TIME), also how long
+                to wait for a free connection; no limit when None
+
+        Raises:
+            TimeoutError: every connection stayed busy for `timeout` seconds
+        """
+        started = time.monotonic()
+        try:
+            connection = self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError("No template connection became free in time")
+
+        try:
+            ## Whatever the wait for a connection used up is not available to the query
+            remaining = None if timeout is None else max(0.001, timeout - (time.monotonic() - started))
+            return connection.execute(sql, params, remaining)
+        finally:
+            self._idle.put(connection)
+
+statement_cache = PreparedStatementCache()
+
+
+def _display_sql(sql, params):
+    shown = [f"'{param}'" if isinstance(param, (str, datetime.date)) else str(param) for param in params]
+    return sql % tuple(shown)
+
+
+def answer_from_template(question, deadline=None):
+    """
+    Answers a question from a template without any LLM call.
+
+    Raises:
+        DeadlineExceeded: the query ran out of the request's time
+    Returns:
+        None when no template matches or the query fails (the caller falls back to the LLM path),
+        otherwise the same dict as sql_generator.generate_sql_response
+    """
+    matched = match_template(question)
+    if not matched:
+        return None
+
+    name, sql, params = matched
+    sql_query = _display_sql(sql, params)
+    print(f"\n\nAnswering from template {name}: {sql_query}")
+
+    deadline = deadline or Deadline()
+    try:
+        description, rows = statement_cache.execute(sql, params, deadline.remaining())
+    except Exception as e:
+        if getattr(e, "errno", None) == ER_QUERY_TIMEOUT or deadline.expired():
+            raise deadline.timed_out("sql_execution")
+        print(f"Template query error, falling back to the SQL generator: {str(e)}")
+        return None
+
+    ## Aggregates over no matching rows come back as a single NULL
+    if not rows or all(value is None for row in rows for value in row):
+        if name in FREE_TEXT_TEMPLATES:
+            print(f"Template {name} found no rows, falling back to the SQL generator")
+            return None
+        message = "there is no such data in the db"
+        return {
+            'status': 'error',
+            'sql_query': sql_query,
+            'message': message,
+            'error': message
+        }
+
+    return {
+        'status': 'success',
+        'columns': describe_columns(description),
+        'rows': rows,
+        'sql_query': sql_query,
+        'message': f'Successfully returned a valid SQL result (template: {name})'
+    }
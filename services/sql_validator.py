@@ -0,0 +1,201 @@
+"""
+Local checks on generated SQL, run before it reaches the database
+
+A query is valid when it is a single SELECT statement without side effects (no INTO
+OUTFILE, locking reads, SLEEP, ...) and every identifier it uses is a table of the schema
+given to the model, a column of a table the query reads (FROM / JOIN), an alias it
+defines, or SQL syntax. `alias.column` must be a column of the aliased table.
+"""
+
+import re
+
+## Tokens: strings, backtick identifiers, comments, numbers, words, operators
+_TOKEN = re.compile(r"""
+    (?P<string>'(?:[^'\\]|\\.|'')*'|"(?:[^"\\]|\\.|"")*")
+  | (?P<quoted>`[^`]+`)
+  | (?P<comment>--|\#|/\*)
+  | (?P<number>\d+(?:\.\d+)?)
+  | (?P<word>[A-Za-z_][A-Za-z0-9_$]*)
+  | (?P<symbol>[^\s\w])
+""", re.VERBOSE)
+
+## Words that can't appear in a read-only query
+FORBIDDEN = {
+    "insert", "update", "delete", "drop", "alter", "create", "truncate", "rename", "grant", "revoke",
+    "into", "outfile", "dumpfile", "load_file", "lock", "sleep", "benchmark", "get_lock",
+    "call", "handler", "prepare", "execute", "deallocate", "shutdown", "kill", "flush",
+}
+
+## Keywords that end the table list of a FROM clause
+_END_OF_FROM = {"where", "group", "order", "having", "limit", "on", "using", "union", "select", "window"}
+
+## SQL syntax that isn't a table, column, alias or function call
+KEYWORDS = {
+    "select", "from", "where", "and", "or", "not", "xor", "in", "is", "null", "like", "between", "exists",
+    "group", "by", "order", "having", "limit", "offset", "as", "on", "using", "join", "inner", "left",
+    "right", "outer", "cross", "natural", "straight_join", "union", "all", "any", "some", "distinct",
+    "distinctrow", "asc", "desc", "case", "when", "then", "else", "end", "interval", "true", "false",
+    "unknown", "div", "mod", "regexp", "rlike", "escape", "with", "rollup", "binary", "collate",
+    "separator", "over", "partition", "rows", "range", "preceding", "following", "unbounded",
+    "current", "row", "current_date", "current_time", "current_timestamp", "localtime",
+    "localtimestamp", "utc_date", "utc_time", "utc_timestamp",
+    # interval units
+    "microsecond", "second", "minute", "hour", "day", "week", "month", "quarter", "year",
+    "second_microsecond", "minute_second", "hour_minute", "day_hour", "day_minute", "day_second",
+    "year_month",
+    # CAST / CONVERT target types
+    "signed", "unsigned", "integer", "int", "decimal", "char", "date", "datetime", "time", "double",
+    "float", "json",
+}
+
+
+def schema_from_prompt(prompt):
+    """
+    Reads the tables and columns out of the schema section of the SQL generation prompt,
+    so validation always matches what the model was told.
+
+    Returns:
+        {table: [columns]}
+    """
+    schema, table = {}, None
+    for line in prompt.splitlines():
+        line = line.strip()
+        table_match = re.match(r"^Table:\s*(\w+)", line)
+        column_match = re.match(r"^-\s*(\w+):", line)
+        if table_match:
+            table = table_match.group(1)
+            schema[table] = []
+        elif column_match and table:
+            schema[table].append(column_match.group(1))
+        elif not line.startswith("-"):
+            table = None
+    return schema
+
+
+def _tokenize(sql):
+    tokens = []
+    for match in _TOKEN.finditer(sql):
+        kind = match.lastgroup
+        value = match.group()
+        if kind == "quoted":
+            kind, value = "word", value[1:-1]
+        tokens.append((kind, value))
+    return tokens
+
+
+def validate_sql(sql, schema):
+    """
+    Args:
+        sql (str): generated query
+        schema (dict): {table: [columns]}, see schema_from_prompt
+
+    Returns:
+        {"valid": bool, "safe": bool, "reason": str}
+        safe is False when the query must never run (not a single read-only SELECT),
+        True when it only failed the schema check.
+    """
+    def rejected(reason, safe=False):
+        return {"valid": False, "safe": safe, "reason": reason}
+
+    sql = sql.strip()
+    if sql.endswith(";"):
+        sql = sql[:-1].rstrip()
+    if not sql:
+        return rejected("empty query")
+
+    tokens = _tokenize(sql)
+
+    if any(kind == "comment" for kind, _ in tokens):
+        return rejected("comments are not allowed")
+    if any(value == ";" for kind, value in tokens if kind == "symbol"):
+        return rejected("multiple statements")
+    if tokens[0][0] != "word" or tokens[0][1].lower() != "select":
+        return rejected("not a SELECT statement")
+
+    depth = 0
+    for kind, value in tokens:
+        if kind == "symbol" and value == "(":
+            depth += 1
+        elif kind == "symbol" and value == ")":
+            depth -= 1
+            if depth < 0:
+                break
+    if depth != 0:
+        return rejected("unbalanced parentheses")
+
+    words = [value.lower() for kind, value in tokens if kind == "word"]
+    forbidden = sorted(set(words) & FORBIDDEN)
+    if forbidden:
+        return rejected(f"forbidden keyword: {', '.join(forbidden)}")
+
+    table_columns = {table.lower(): {column.lower() for column in cols} for table, cols in schema.items()}
+    tables = set(table_columns)
+
+    ## Tables read by the query (FROM / JOIN, comma-separated lists too) and what their aliases stand for
+    sources = {}
+    in_from = False
+    for i, (kind, value) in enumerate(tokens):
+        word = value.lower() if kind == "word" else None
+        if word in ("from", "join"):
+            in_from = True
+        elif word in _END_OF_FROM:
+            in_from = False
+        elif in_from and word in tables and (tokens[i - 1] == ("symbol", ",") or tokens[i - 1][1].lower() in ("from", "join")):
+            sources[word] = word
+            alias = i + 1
+            if alias < len(tokens) and tokens[alias][0] == "word" and tokens[alias][1].lower() == "as":
+                alias += 1
+            if alias < len(tokens) and tokens[alias][0] == "word" and tokens[alias][1].lower() not in KEYWORDS:
+                sources[tokens[alias][1].lower()] = word
+
+    ## Columns unqualified names may use: those of the tables read, or all when none was recognised
+    read_tables = set(sources.values()) or tables
+    columns = set().union(*(table_columns[table] for table in read_tables))
+
+    ## First pass: aliases, i.e. words after AS or directly after a name, literal or closing parenthesis
+    aliases = set()
+    for i in range(1, len(tokens)):
+        kind, value = tokens[i]
+        if kind != "word" or value.lower() in KEYWORDS:
+            continue
+        if i + 1 < len(tokens) and tokens[i + 1] == ("symbol", "("):
+            continue
+        prev_kind, prev_value = tokens[i - 1]
+        if prev_kind == "word" and prev_value.lower() == "as":
+            aliases.add(value.lower())
+        elif prev_kind in ("string", "number") or (prev_kind == "symbol" and prev_value == ")"):
+            aliases.add(value.lower())
+        elif prev_kind == "word" and prev_value.lower() not in KEYWORDS:
+            aliases.add(value.lower())
+
+    ## Second pass: everything else has to come from the schema
+    for i, (kind, value) in enumerate(tokens):
+        if kind != "word":
+            continue
+        name = value.lower()
+        if name in KEYWORDS or name in aliases:
+            continue
+        if i + 1 < len(tokens) and tokens[i + 1] == ("symbol", "("):
+            continue  # function call
+
+        if tokens[i - 1][0] == "word" and tokens[i - 1][1].lower() in ("from", "join") and name not in tables:
+            return rejected(f"unknown table: {value}", safe=True)
+
+        qualified = i >= 2 and tokens[i - 1] == ("symbol", ".")
+        qualifier = i + 1 < len(tokens) and tokens[i + 1] == ("symbol", ".")
+        if qualifier and name not in tables:
+            return rejected(f"unknown table: {value}", safe=True)
+        if not qualifier and not qualified and name in tables:
+            continue
+        if qualifier:
+            continue
+
+        ## alias.column / table.column: the column has to be in that table,
+        ## other qualifiers (derived tables) fall back to the tables read
+        owner = sources.get(tokens[i - 2][1].lower()) if qualified else None
+        if owner and name not in table_columns[owner]:
+            return rejected(f"unknown column: {tokens[i - 2][1]}.{value}", safe=True)
+        if name not in columns:
+            return rejected(f"unknown column: {value}", safe=True)
+
+    return {"valid": True, "safe": True, "reason": ""}